@@ -5,20 +5,26 @@ password = 'weshy'
 
 base_url = 'http://127.0.0.1:8000/api/'
 
-# retrieve all courses
-r = requests.get(f'{base_url}courses/')
-courses = r.json()
+# retrieve all courses, page by page
+courses = []
+url = f'{base_url}courses/?fields=id,title'
+while url:
+    r = requests.get(url)
+    page = r.json()
+    courses += page['results']
+    url = page['next']
 
 available_courses = ', '.join(course['title'] for course in courses)
 print(f'Available courses: {available_courses}')
 
-for course in courses:
-    course_id = course['id']
-    course_title = course['title']
+# enroll in every course with a single request
+titles = {course['id']: course['title'] for course in courses}
+r = requests.post(f'{base_url}courses/enroll/',
+                    json={'courses': list(titles)},
+                    auth=(username, password))
 
-    r = requests.post(f'{base_url}courses/{course_id}/enroll/', 
-                                            auth=(username, password))
-    
-    if r.status_code == 200:
-        # succefful requuest
-        print(f'Successfully enrolled in {course_title}')
\ No newline at end of file
+if r.status_code == 200:
+    # succefful requuest
+    for result in r.json()['results']:
+        if 'error' not in result:
+            print(f'Successfully enrolled in {titles[result["course"]]}')
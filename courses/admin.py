@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Subject, Course, Module
+from .models import ApiToken, Subject, Course, Module
 
 # Register your models here.
 @admin.register(Subject)
@@ -17,3 +17,14 @@ class CourseAdmin(admin.ModelAdmin):
     search_fields = ['title', 'overview']
     prepopulated_fields = {'slug': ('title',)}
     inlines = [ModuleInline]
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ['prefix', 'user', 'name', 'created']
+    search_fields = ['user__username', 'name', 'prefix']
+    raw_id_fields = ['user']
+
+    # Tokens are issued through the API, which shows the key once
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,33 @@
+from rest_framework import exceptions
+from rest_framework.authentication import (BaseAuthentication,
+                                           get_authorization_header)
+
+from .. import tokens
+
+
+'''
+"Authorization: Token <key>" with a key from POST /api/token/. request.auth
+is the digest of the key.
+'''
+class TokenAuthentication(BaseAuthentication):
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+
+        token_digest = tokens.digest(key)
+        user = tokens.get_user(token_digest)
+        if user is None:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        return (user, token_digest)
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -1,5 +1,15 @@
 from rest_framework.permissions import BasePermission
 
+from ..enrollment import is_enrolled
+
 class IsEnrolled(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.students.filter(id=request.user.id).exists()
\ No newline at end of file
+        return is_enrolled(request.user.id, obj.id)
+
+class IsCourseOwner(BasePermission):
+    def has_object_permission(self, request, view, obj):
+        return obj.owner_id == request.user.id or request.user.is_staff
+
+class CanCreateCourses(BasePermission):
+    def has_permission(self, request, view):
+        return request.user.has_perm('courses.add_course')
\ No newline at end of file
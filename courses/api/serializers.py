@@ -1,6 +1,10 @@
+from django.utils import timezone
+from django.utils.functional import cached_property
 from rest_framework import serializers
 
-from ..models import Module, Subject, Course, Content
+from .. import media
+from ..models import (ApiToken, Module, Subject, Course, Content, File,
+                      Image, Upload)
 
 
 class SubjectSerializer(serializers.ModelSerializer):
@@ -15,17 +19,121 @@ class ModuleSerialaizer(serializers.ModelSerializer):
         fields = ['order', 'title', 'description']
 
 
-class CourseSerializer(serializers.ModelSerializer):
+def query_param_list(request, name):
+    value = request.query_params.get(name, '') if request else ''
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def selected_fields(request, names, expandable):
+    expand = query_param_list(request, 'expand')
+    fields = query_param_list(request, 'fields')
+    return [name for name in names
+            if (name not in expandable or name in expand)
+            and (not fields or name in fields or name in expand)]
+
+
+'''
+?fields=id,title limits the output to the given fields. The nested fields
+listed in Meta.expandable are left out unless ?expand= asks for them, so a
+listing does not have to load them at all.
+'''
+class DynamicFieldsMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = selected_fields(self.context.get('request'), self.fields,
+                               getattr(self.Meta, 'expandable', []))
+        for name in set(self.fields) - set(keep):
+            self.fields.pop(name)
+
+
+class CourseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     modules = ModuleSerialaizer(many=True, read_only = True)
     class Meta:
         model = Course
         fields = ['id', 'subject', 'title', 'slug', 'overview',
                         'created', 'owner', 'modules']
+        expandable = ['modules']
+
+
+class CourseValuesListSerializer(serializers.ListSerializer):
+    def to_representation(self, rows):
+        rows = list(rows)
+        if 'modules' in self.child.field_names:
+            self.child.load_modules([row['id'] for row in rows])
+        return [self.child.to_representation(row) for row in rows]
+
+
+'''
+CourseSerializer for the rows of .values(), used by the list and retrieve
+actions of CourseViewSet. There are no model instances and no field objects
+per row. The values are copied from the row (created is formatted like
+DateTimeField does) and the modules of all the courses come from one
+query, so the JSON renderer gets plain dicts and encodes the page with a
+single json.dumps(). The output must stay the same as CourseSerializer's,
+see courses/tests.py.
+'''
+class CourseValuesSerializer(serializers.BaseSerializer):
+    # Output name: column of the row
+    COLUMNS = {'subject': 'subject_id', 'owner': 'owner_id'}
+
+    class Meta:
+        fields = CourseSerializer.Meta.fields
+        expandable = CourseSerializer.Meta.expandable
+        module_fields = ModuleSerialaizer.Meta.fields
+        list_serializer_class = CourseValuesListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.modules = None
+
+    @classmethod
+    def columns(cls, request):
+        # The keyset pagination needs id and created in every row
+        names = selected_fields(request, cls.Meta.fields, cls.Meta.expandable)
+        return list(dict.fromkeys(['id', 'created'] +
+                                  [cls.COLUMNS.get(name, name)
+                                   for name in names if name != 'modules']))
+
+    @cached_property
+    def field_names(self):
+        return selected_fields(self.context.get('request'), self.Meta.fields,
+                               self.Meta.expandable)
+
+    @cached_property
+    def datetime_field(self):
+        # Looking up the current time zone for every row is the slow part
+        return serializers.DateTimeField(
+                            default_timezone=timezone.get_current_timezone())
+
+    def load_modules(self, course_ids):
+        self.modules = {course_id: [] for course_id in course_ids}
+        for module in Module.objects.filter(course_id__in=course_ids) \
+                            .values('course_id', *self.Meta.module_fields):
+            self.modules[module.pop('course_id')].append(module)
+
+    def to_representation(self, row):
+        data = {}
+        for name in self.field_names:
+            if name == 'modules':
+                if self.modules is None:
+                    self.load_modules([row['id']])
+                data[name] = self.modules[row['id']]
+            elif name == 'created':
+                data[name] = self.datetime_field.to_representation(row[name])
+            else:
+                data[name] = row[self.COLUMNS.get(name, name)]
+        return data
 
 
 class ItemRelatedField(serializers.RelatedField):
     def to_representation(self, value):
-        return value.render()
+        html = value.render()
+        request = self.context.get('request')
+        if isinstance(value, (File, Image)) and request is not None:
+            # API clients have no session for the media links
+            html = media.sign_links(html, value._meta.model_name, value.id,
+                                    request.user.id)
+        return html
 
 
 class ContentSerialazer(serializers.ModelSerializer):
@@ -48,4 +156,44 @@ class CourseWithContentsSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Course
-        fields = ['id', 'title', 'subject', 'slug', 'overview', 'created', 'owner', 'modules']
\ No newline at end of file
+        fields = ['id', 'title', 'subject', 'slug', 'overview', 'created', 'owner', 'modules']
+
+
+class BulkEnrollSerializer(serializers.Serializer):
+    courses = serializers.ListField(child=serializers.IntegerField(min_value=1),
+                                    allow_empty=False)
+    # Only staff members may enroll other users
+    users = serializers.ListField(child=serializers.IntegerField(min_value=1),
+                                  allow_empty=False, required=False)
+
+
+# The title and slug of a copy of a course, both optional
+class CourseCloneSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=200, required=False)
+    slug = serializers.SlugField(max_length=200, required=False)
+
+    def validate_slug(self, slug):
+        if Course.objects.filter(slug=slug).exists():
+            raise serializers.ValidationError(
+                                f'A course with the slug "{slug}" exists.')
+        return slug
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Upload
+        fields = ['id', 'module', 'model_name', 'title', 'filename',
+                  'size', 'offset', 'created', 'updated']
+        read_only_fields = ['offset']
+
+    def validate_module(self, module):
+        if module.course.owner_id != self.context['request'].user.id:
+            raise serializers.ValidationError('Not a module of your course.')
+        return module
+
+
+class ApiTokenSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ApiToken
+        fields = ['id', 'name', 'prefix', 'created']
+        read_only_fields = ['prefix']
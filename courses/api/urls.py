@@ -13,10 +13,19 @@ urlpatterns = [
                                             name='subject_list'),
     path('subjects/<pk>/', views.SubjectDetailView.as_view(),
                                             name='subject_detail'),
+    path('courses/enroll/', views.CourseBulkEnrollView.as_view(),
+                                            name='course_bulk_enroll'),
+    path('courses/import/', views.CourseImportView.as_view(),
+                                            name='course_import'),
     path('courses/<pk>/enroll/', views.CourseEnrollView.as_view(),
                                             name='course_enroll'),
-    path('courses/<pk>/enroll/', views.CourseEnrollView.as_view(),
-                                            name='course_enroll'),
+    path('token/', views.TokenView.as_view(), name='token'),
+    path('uploads/', views.UploadCreateView.as_view(),
+                                            name='upload_create'),
+    path('uploads/<uuid:pk>/', views.UploadDetailView.as_view(),
+                                            name='upload_detail'),
+    path('uploads/<uuid:pk>/finish/', views.UploadFinishView.as_view(),
+                                            name='upload_finish'),
 
     path('', include(router.urls))
 ]
@@ -1,21 +1,40 @@
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, viewsets
 from rest_framework.authentication import BasicAuthentication
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from ..models import Course, Subject
-from .permissions import IsEnrolled
-from .serializers import (CourseSerializer, CourseWithContentsSerializer,
-                          SubjectSerializer)
+from education.querybudget import query_budget
 
+from .. import conditional, media, tokens, uploads
+from ..cloning import clone_course
+from ..enrollment import bulk_enroll, is_enrolled
+from ..export import export_course
+from ..importer import (CourseImporter, CourseImportError, course_field,
+                        read_courses)
+from ..models import ApiToken, Course, Module, Subject, Upload
+from .authentication import TokenAuthentication
+from .pagination import CourseCursorPagination, SubjectCursorPagination
+from .permissions import CanCreateCourses, IsCourseOwner, IsEnrolled
+from .serializers import (ApiTokenSerializer, BulkEnrollSerializer,
+                          CourseCloneSerializer, CourseSerializer,
+                          CourseValuesSerializer, CourseWithContentsSerializer,
+                          SubjectSerializer, UploadSerializer,
+                          query_param_list)
 
+
+@query_budget(3)
 class SubjectListView(generics.ListAPIView):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
+    pagination_class = SubjectCursorPagination
 
+@query_budget(3)
 class SubjectDetailView(generics.RetrieveAPIView):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
@@ -23,7 +42,7 @@ class SubjectDetailView(generics.RetrieveAPIView):
 
 ''''''
 class CourseEnrollView(APIView):
-    authentication_classes = (BasicAuthentication,)
+    authentication_classes = (TokenAuthentication, BasicAuthentication)
     permission_classes = (IsAuthenticated,)
     def post(self, request, pk, format=None):
         course = get_object_or_404(Course, pk=pk)
@@ -31,24 +50,262 @@ class CourseEnrollView(APIView):
         return Response({'enrolled': True})
 
 
+# Enrolls one or more users in a list of courses with a single request
+class CourseBulkEnrollView(APIView):
+    authentication_classes = (TokenAuthentication, BasicAuthentication)
+    permission_classes = (IsAuthenticated,)
+    def post(self, request, format=None):
+        serializer = BulkEnrollSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data.get('users')
+        if user_ids is None:
+            user_ids = [request.user.id]
+        elif not request.user.is_staff:
+            raise PermissionDenied('Only staff members can enroll other users.')
+
+        return Response(bulk_enroll(serializer.validated_data['courses'],
+                                    user_ids))
+
+
+'''
+POST trades the password (HTTP Basic) for a token, the key is in the
+response only. DELETE revokes the token sent with the request.
+See courses/tokens.py.
+'''
+class TokenView(APIView):
+    authentication_classes = (TokenAuthentication, BasicAuthentication)
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, format=None):
+        # A leaked token must not be able to create more tokens
+        if not isinstance(request.successful_authenticator,
+                          BasicAuthentication):
+            raise PermissionDenied('A new token needs the password.')
+        serializer = ApiTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token, key = tokens.issue(request.user,
+                                  serializer.validated_data.get('name', ''))
+        return Response({**ApiTokenSerializer(token).data, 'token': key},
+                        status=201)
+
+    def delete(self, request, format=None):
+        if not isinstance(request.successful_authenticator,
+                          TokenAuthentication):
+            return Response({'detail': 'Send the token to revoke.'},
+                            status=400)
+        ApiToken.objects.filter(digest=request.auth).delete()
+        return Response(status=204)
+
+
+'''
+Imports courses in the format of the export action. The body is either a
+JSON document or JSON lines (one course per line), read as a stream.
+'''
+class CourseImportView(APIView):
+    authentication_classes = (TokenAuthentication, BasicAuthentication)
+    permission_classes = (IsAuthenticated, CanCreateCourses)
+    def post(self, request, format=None):
+        importer = CourseImporter()
+        results = []
+        try:
+            for data in read_courses(request._request):
+                try:
+                    course = importer.import_course(data, request.user)
+                except CourseImportError as e:
+                    results.append({'slug': course_field(data, 'slug'),
+                                    'error': str(e)})
+                    continue
+                results.append({'slug': course.slug, 'id': course.id})
+        except ValueError as e:
+            return Response({'detail': f'Invalid JSON: {e}',
+                             'results': results}, status=400)
+
+        return Response({'results': results, 'stats': importer.stats})
+
+
+'''
+Chunked uploads of File and Image content, see courses/uploads.py.
+
+    POST   uploads/             module, model_name, title, filename, size
+    GET    uploads/<id>/        the offset to resume from
+    PUT    uploads/<id>/        raw bytes of the next chunk, with the
+                                Upload-Offset header set to its offset
+    POST   uploads/<id>/finish/ optional sha256, creates the content
+    DELETE uploads/<id>/        gives up
+'''
+class UploadCreateView(APIView):
+    authentication_classes = (TokenAuthentication, BasicAuthentication)
+    permission_classes = (IsAuthenticated,)
+    def post(self, request, format=None):
+        serializer = UploadSerializer(data=request.data,
+                                      context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        try:
+            upload = uploads.start(request.user, **serializer.validated_data)
+        except uploads.UploadError as e:
+            return Response({'detail': str(e)}, status=400)
+        return Response(UploadSerializer(upload).data, status=201)
+
+
+class UploadDetailView(APIView):
+    authentication_classes = (TokenAuthentication, BasicAuthentication)
+    permission_classes = (IsAuthenticated,)
+    def get(self, request, pk, format=None):
+        upload = get_object_or_404(Upload, pk=pk, owner=request.user)
+        response = Response(UploadSerializer(upload).data)
+        response['Upload-Offset'] = upload.offset
+        return response
+
+    def put(self, request, pk, format=None):
+        get_object_or_404(Upload, pk=pk, owner=request.user)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response({'detail': 'Upload-Offset and Content-Length '
+                                       'headers are required.'}, status=400)
+        try:
+            # Read the body straight from the WSGI stream, not through
+            # the parsers
+            upload = uploads.append(pk, request.user, offset,
+                                    request._request, length)
+        except uploads.OffsetMismatch as e:
+            response = Response({'detail': str(e), 'offset': e.offset},
+                                status=409)
+            response['Upload-Offset'] = e.offset
+            return response
+        except uploads.UploadError as e:
+            return Response({'detail': str(e)}, status=400)
+        response = Response({'offset': upload.offset, 'size': upload.size})
+        response['Upload-Offset'] = upload.offset
+        return response
+
+    def delete(self, request, pk, format=None):
+        upload = get_object_or_404(Upload, pk=pk, owner=request.user)
+        uploads.abort(upload)
+        return Response(status=204)
+
+
+class UploadFinishView(APIView):
+    authentication_classes = (TokenAuthentication, BasicAuthentication)
+    permission_classes = (IsAuthenticated,)
+    def post(self, request, pk, format=None):
+        get_object_or_404(Upload, pk=pk, owner=request.user)
+        try:
+            content, digest = uploads.finish(pk, request.user,
+                                             request.data.get('sha256'))
+        except uploads.OffsetMismatch as e:
+            return Response({'detail': 'The upload is not complete.',
+                             'offset': e.offset}, status=409)
+        except uploads.UploadError as e:
+            return Response({'detail': str(e)}, status=400)
+        return Response({'content': content.id,
+                         'model_name': content.content_type.model,
+                         'item': content.object_id,
+                         'sha256': digest}, status=201)
+
+
+@query_budget(list=4, retrieve=4, contents=10, clone=24)
 class CourseViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
+    pagination_class = CourseCursorPagination
+    # Served from .values() rows, see CourseValuesSerializer
+    values_actions = ('list', 'retrieve')
+
+    def get_serializer_class(self):
+        if self.action in self.values_actions:
+            return CourseValuesSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action in self.values_actions:
+            qs = qs.values(*CourseValuesSerializer.columns(self.request))
+        elif self.action == 'contents':
+            qs = qs.prefetch_related(Prefetch(
+                'modules', queryset=Module.objects.with_contents()))
+        elif self.action == 'export':
+            qs = qs.select_related('subject', 'owner')
+        elif 'modules' in query_param_list(self.request, 'expand'):
+            qs = qs.prefetch_related('modules')
+        return qs
 
     @action(detail=True, 
             methods=['post'],
-            authentication_classes=[BasicAuthentication,],
+            authentication_classes=[TokenAuthentication,
+                                    BasicAuthentication],
             permission_classes=[IsAuthenticated,])
     def enroll(self, request, *args, **kwargs):
         course = self.get_object()
-        course.stuents.add(request.user)
+        course.students.add(request.user)
         return Response({'enrolled': True})
 
 
     @action(detail=True,
             methods=['get'],
             serializer_class=CourseWithContentsSerializer,
-            authentication_classes=[BasicAuthentication,],
+            authentication_classes=[TokenAuthentication,
+                                    BasicAuthentication],
             permission_classes=[IsAuthenticated, IsEnrolled])
     def contents(self, request, *args, **kwargs):
-        return self.retrieve(request, *args, **kwargs)
\ No newline at end of file
+        version = self.get_contents_version()
+        if version is None:
+            return self.retrieve(request, *args, **kwargs)
+        etag, updated = version
+        response = conditional.not_modified(request, etag, updated)
+        if response is None:
+            response = self.retrieve(request, *args, **kwargs)
+        return conditional.set_validators(response, etag, updated)
+
+    def get_contents_version(self):
+        # The same check as IsEnrolled, before the course is loaded
+        try:
+            course_id = int(self.kwargs['pk'])
+        except ValueError:
+            return None
+        if not is_enrolled(self.request.user.id, course_id):
+            return None
+        row = Course.objects.filter(pk=course_id) \
+                            .values('content_version', 'updated').first()
+        if row is None:
+            return None
+        # The media links are signed for the user and expire
+        etag = conditional.make_etag('contents', row['content_version'],
+                                     self.request.accepted_renderer.format,
+                                     self.request.GET.urlencode(),
+                                     self.request.user.id,
+                                     media.signing_window())
+        return etag, row['updated']
+
+
+    @action(detail=True,
+            methods=['get'],
+            authentication_classes=[TokenAuthentication,
+                                    BasicAuthentication],
+            permission_classes=[IsAuthenticated, IsCourseOwner])
+    def export(self, request, *args, **kwargs):
+        course = self.get_object()
+        response = StreamingHttpResponse(export_course(course),
+                                         content_type='application/json')
+        response['Content-Disposition'] = \
+                            f'attachment; filename="{course.slug}.json"'
+        return response
+
+    # A copy of the course for a new term, see courses/cloning.py
+    @action(detail=True,
+            methods=['post'],
+            authentication_classes=[TokenAuthentication,
+                                    BasicAuthentication],
+            permission_classes=[IsAuthenticated, IsCourseOwner,
+                                CanCreateCourses])
+    def clone(self, request, *args, **kwargs):
+        course = self.get_object()
+        serializer = CourseCloneSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        clone = clone_course(course, owner=request.user,
+                             **serializer.validated_data)
+        return Response({'id': clone.id, 'slug': clone.slug,
+                         'title': clone.title,
+                         'modules': clone.module_count,
+                         'contents': clone.content_count}, status=201)
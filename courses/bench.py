@@ -0,0 +1,229 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import counters, tokens
+from .models import (ORDER_GAP, Content, Course, File, Image, Module, Subject,
+                     Text, Video)
+from .storage import content_storage
+
+'''
+Synthetic data and request timings for the bench command.
+
+build_dataset() fills an empty database with bulk inserts: subjects,
+courses spread over them, modules, a mix of Text, Video, File and Image
+items, and students enrolled in random courses. Every File and Image points
+to the same small blob, as the content addressed storage would.
+
+run() then requests the hot pages in-process through the test client and
+reports, per endpoint, the latency percentiles, serial_rps, the number of
+SQL queries and the size of the responses. serial_rps is 1 / mean latency,
+what one client waiting for every answer gets. It is no server throughput:
+that depends on the gunicorn workers and threads, measure it with a load
+generator against the server.
+Between requests, connections are closed as the request handler closes
+them, so CONN_MAX_AGE counts like in a server. compare() sets two reports
+side by side, e.g. before and after a settings change.
+'''
+
+PASSWORD = 'bench'
+BATCH_SIZE = 1000
+ITEM_MODELS = (Text, Video, File, Image)
+
+
+def _bulk(model, objs):
+    model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+    return objs
+
+
+def build_dataset(subjects=5, courses=50, modules=5, contents=10,
+                  students=200, enrollments=5, seed=0):
+    rng = random.Random(seed)
+    # Hashing once keeps creating thousands of users fast
+    password = make_password(PASSWORD)
+    blob = content_storage.save('files/bench.txt', ContentFile(b'bench'))
+
+    with transaction.atomic():
+        owner = User.objects.create(username='bench-owner', password=password)
+        users = _bulk(User, [User(username=f'bench-student-{i}',
+                                  password=password)
+                             for i in range(students)])
+        subject_objs = _bulk(Subject, [Subject(title=f'Subject {i}',
+                                               slug=f'subject-{i}')
+                                       for i in range(subjects)])
+        course_objs = _bulk(Course, [
+                    Course(owner=owner, subject=rng.choice(subject_objs),
+                           title=f'Course {i}', slug=f'course-{i}',
+                           overview='Overview of the course. ' * 20)
+                    for i in range(courses)])
+        module_objs = _bulk(Module, [
+                    Module(course=course, title=f'Module {i}',
+                           description='About this module.',
+                           order=(i + 1) * ORDER_GAP)
+                    for course in course_objs for i in range(modules)])
+
+        placed = []
+        items = {model: [] for model in ITEM_MODELS}
+        for module in module_objs:
+            for i in range(contents):
+                model = ITEM_MODELS[i % len(ITEM_MODELS)]
+                item = model(owner=owner, title=f'{model.__name__} {i}')
+                if model is Text:
+                    item.content = 'Some text to read. ' * 50
+                elif model is Video:
+                    item.url = 'https://www.youtube.com/watch?v=bench'
+                else:
+                    item.file = blob
+                items[model].append(item)
+                placed.append((module, (i + 1) * ORDER_GAP, item))
+        for model, objs in items.items():
+            _bulk(model, objs)
+            # The File and Image templates link to the item by id
+            for item in objs:
+                item.rendered = item.render_template()
+                item.rendered_version = model.render_version()
+            model.objects.bulk_update(objs, ['rendered', 'rendered_version'],
+                                      batch_size=BATCH_SIZE)
+        _bulk(Content, [Content(module=module,
+                                content_type=ContentType.objects.get_for_model(item),
+                                object_id=item.pk,
+                                order=order)
+                        for module, order, item in placed])
+
+        Enrollment = Course.students.through
+        _bulk(Enrollment, [Enrollment(course_id=course.id, user_id=user.id)
+                           for user in users
+                           for course in rng.sample(course_objs,
+                                                    min(enrollments,
+                                                        len(course_objs)))])
+        # bulk_create() does not send the signals that keep the counters
+        counters.recount()
+
+    return {'subjects': subjects, 'courses': courses,
+            'modules': len(module_objs), 'contents': len(placed),
+            'students': students,
+            'enrollments': Enrollment.objects.count()}
+
+
+def percentile(values, percent):
+    # Nearest rank
+    ordered = sorted(values)
+    rank = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[int(rank)]
+
+
+def _content(response):
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+def measure(client, urls, requests, warmup, **headers):
+    '''
+    Requests the urls in turn, warmup times without measuring, then
+    requests times, and returns the statistics of the measured requests.
+    '''
+    for url in urls[:warmup]:
+        _content(client.get(url, **headers))
+
+    timings, queries, sizes, statuses = [], [], [], {}
+    for i in range(requests):
+        url = urls[i % len(urls)]
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = client.get(url, **headers)
+            body = _content(response)
+            # The test client keeps the connections open, the handler
+            # closes them unless CONN_MAX_AGE allows to keep them
+            close_old_connections()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured.captured_queries))
+        sizes.append(len(body))
+        statuses[response.status_code] = statuses.get(response.status_code,
+                                                      0) + 1
+
+    return {'requests': requests,
+            'status': {str(code): count for code, count in statuses.items()},
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'serial_rps': round(len(timings) / (sum(timings) / 1000), 1),
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+            'bytes_mean': round(sum(sizes) / len(sizes))}
+
+
+def endpoints(seed=0, sample=20):
+    '''
+    Returns {name: (urls, client, headers)} for the hot paths, each with a
+    sample of different objects so not every request hits the same rows.
+    '''
+    rng = random.Random(seed)
+    user = rng.choice(User.objects.filter(courses_joined__isnull=False)
+                                  .distinct().order_by('id'))
+    course_ids = list(user.courses_joined.values_list('id', flat=True))
+    courses = list(Course.objects.values_list('id', 'slug'))
+    courses = rng.sample(courses, min(sample, len(courses)))
+    subjects = list(Subject.objects.values_list('slug', flat=True))
+
+    anonymous = Client()
+    student = Client()
+    student.force_login(user)
+    api = Client()
+    _, key = tokens.issue(user, 'bench')
+    token = {'HTTP_AUTHORIZATION': f'Token {key}'}
+
+    return {
+        'course_list': ([reverse('course_list')] +
+                        [reverse('course_list_subject', args=[slug])
+                         for slug in subjects], anonymous, {}),
+        'course_detail': ([reverse('course_detail', args=[slug])
+                           for _, slug in courses], anonymous, {}),
+        'student_course_detail': ([reverse('student_course_detail',
+                                           args=[course_id])
+                                   for course_id in course_ids],
+                                  student, {}),
+        'api_course_list': ([reverse('api:course-list')], api, {}),
+        'api_course_contents': ([reverse('api:course-contents',
+                                         args=[course_id])
+                                 for course_id in course_ids], api, token),
+    }
+
+
+def run(requests=50, warmup=5, seed=0, only=None):
+    results = {}
+    for name, (urls, client, headers) in endpoints(seed).items():
+        if only and name not in only:
+            continue
+        results[name] = measure(client, urls, requests, warmup, **headers)
+        results[name]['urls'] = len(urls)
+    return results
+
+
+def compare(before, after):
+    '''
+    Returns {endpoint: numbers before and after} for the endpoints
+    in both reports.
+    '''
+    result = {}
+    for name, new in after['endpoints'].items():
+        old = before['endpoints'].get(name)
+        if old is None:
+            continue
+        # Reports written before the rename call it rps
+        old_rps = old.get('serial_rps', old.get('rps'))
+        result[name] = {'serial_rps_before': old_rps,
+                        'serial_rps_after': new['serial_rps'],
+                        'p50_ms_before': old['p50_ms'],
+                        'p50_ms_after': new['p50_ms']}
+        if old_rps:
+            result[name]['speedup'] = round(new['serial_rps'] / old_rps, 2)
+    return result
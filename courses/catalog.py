@@ -0,0 +1,153 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Course, Subject
+
+'''
+Cache for the public catalog rendered by CourseListView.
+
+The cache holds plain dicts instead of querysets, so a hit never touches the
+database. Every key embeds a generation counter:
+
+    catalog:gen:subjects        the subject list and its course counts
+    catalog:gen:courses         the list of all courses
+    catalog:gen:subject:<id>    the courses of one subject
+
+Bumping a counter makes the old keys unreachable, so writers never have to
+know which keys exist. The signal handlers in courses.signals do the bumping.
+The bumps only reach the processes that share the cache, the other workers
+of a per-process cache serve the old catalog until their entries expire
+(courses.W001).
+
+Entries carry a soft expiry. When it passes, one worker takes a short lock
+and recomputes the entry while the others keep serving the stale rows, so a
+crowd hitting an expired key causes a single query instead of one per
+request.
+'''
+
+CATALOG_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+# How long a stale entry may still be served while it is being rebuilt
+CATALOG_STALE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_STALE_TIMEOUT', 60)
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 0.05
+LOCK_WAIT_STEPS = 20
+
+
+def _gen_key(name):
+    return f'catalog:gen:{name}'
+
+
+def _new_generation():
+    # Start from the clock so a counter evicted from the cache never
+    # comes back with a value that was already used
+    return time.time_ns()
+
+
+def get_generation(name):
+    key = _gen_key(name)
+    gen = cache.get(key)
+    if gen is None:
+        cache.add(key, _new_generation(), None)
+        gen = cache.get(key)
+    return gen
+
+
+def _bump(names):
+    for name in names:
+        key = _gen_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_generation(), None)
+
+
+def bump(*names):
+    # After the commit, otherwise a reader could cache the old rows
+    # under the new generation
+    transaction.on_commit(lambda: _bump(names))
+
+
+def bump_subject(subject_id):
+    bump('subjects', 'courses', f'subject:{subject_id}')
+
+
+def bump_course(*subject_ids):
+    bump('subjects', 'courses',
+         *(f'subject:{subject_id}' for subject_id in subject_ids))
+
+
+def bump_module(subject_id):
+    bump('courses', f'subject:{subject_id}')
+
+
+def _cached(key, compute):
+    entry = cache.get(key)
+    locked = False
+    if entry is not None:
+        expires, rows = entry
+        if expires > time.time():
+            return rows
+        locked = cache.add(f'{key}:lock', 1, LOCK_TIMEOUT)
+        if not locked:
+            # Somebody else is already refreshing it
+            return rows
+    else:
+        locked = cache.add(f'{key}:lock', 1, LOCK_TIMEOUT)
+        if not locked:
+            for _ in range(LOCK_WAIT_STEPS):
+                time.sleep(LOCK_WAIT)
+                entry = cache.get(key)
+                if entry is not None:
+                    return entry[1]
+            # The other worker is too slow, compute it ourselves
+
+    try:
+        rows = compute()
+        cache.set(key, (time.time() + CATALOG_TIMEOUT, rows),
+                  CATALOG_TIMEOUT + CATALOG_STALE_TIMEOUT)
+    finally:
+        if locked:
+            cache.delete(f'{key}:lock')
+    return rows
+
+
+# The counts come from the counter columns, see courses/counters.py
+def _subject_rows():
+    subjects = Subject.objects.values('id', 'title', 'slug', 'course_count')
+    return [{'id': s['id'],
+             'title': s['title'],
+             'slug': s['slug'],
+             'total_courses': s['course_count']} for s in subjects]
+
+
+def _course_rows(subject_id=None):
+    courses = Course.objects.all()
+    if subject_id is not None:
+        courses = courses.filter(subject_id=subject_id)
+    courses = courses.values('id', 'title', 'slug', 'module_count',
+                             'owner__username',
+                             'subject__title', 'subject__slug')
+    return [{'id': c['id'],
+             'title': c['title'],
+             'slug': c['slug'],
+             'total_modules': c['module_count'],
+             'owner': {'username': c['owner__username']},
+             'subject': {'title': c['subject__title'],
+                         'slug': c['subject__slug']}} for c in courses]
+
+
+def get_subjects():
+    gen = get_generation('subjects')
+    return _cached(f'catalog:subjects:{gen}', _subject_rows)
+
+
+def get_courses(subject_id=None):
+    if subject_id is None:
+        gen = get_generation('courses')
+        return _cached(f'catalog:courses:{gen}', _course_rows)
+    gen = get_generation(f'subject:{subject_id}')
+    return _cached(f'catalog:subject:{subject_id}:courses:{gen}',
+                   lambda: _course_rows(subject_id))
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Caches that are not shared between processes, or whose incr() is not
+# atomic across them
+UNSHARED_CACHES = ('django.core.cache.backends.locmem.LocMemCache',
+                   'django.core.cache.backends.dummy.DummyCache',
+                   'django.core.cache.backends.filebased.FileBasedCache',
+                   'django.core.cache.backends.db.DatabaseCache')
+
+
+def cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] not in UNSHARED_CACHES
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [Warning('The default cache is not shared between processes, a '
+                    'change of enrollment or of the catalog only reaches the '
+                    'process that made it.',
+                    hint='Use memcached or Redis for the default cache, '
+                         'see courses/enrollment.py and courses/catalog.py.',
+                    id='courses.W001')]
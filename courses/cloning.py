@@ -0,0 +1,126 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from . import catalog
+from .models import Content, Course, File, Image, Module
+
+'''
+Deep copies of courses, for running a course again in a new term.
+
+A copy takes one transaction and the same handful of queries whatever the
+size of the course: the course is saved, then the modules, the items of
+each content type and the contents are read with one query per model and
+written back with one bulk_create per batch. The new primary keys come
+back from the bulk inserts (PostgreSQL), and the contents are pointed at
+the copies of their items in memory.
+
+File and Image copies keep the name of the original file. The storage
+keeps one blob per distinct file and deletes it only when no row refers to
+it anymore (see courses/storage.py), so nothing is copied on disk. The
+resized copies of images are shared the same way.
+'''
+
+BATCH_SIZE = 500
+
+# Their HTML links to the media URL of the item itself, the copies are
+# rendered again once they have their ids
+LINKED_TO_ITEM = (File, Image)
+
+SLUG_SUFFIX = '-copy'
+
+
+def copy_slug(slug):
+    '''
+    Returns the first free slug among <slug>-copy, <slug>-copy-2, ...
+    '''
+    max_length = Course._meta.get_field('slug').max_length
+    base = slug[:max_length - len(SLUG_SUFFIX) - 4] + SLUG_SUFFIX
+    taken = set(Course.objects.filter(slug__startswith=base).order_by()
+                              .values_list('slug', flat=True))
+    candidate, n = base, 1
+    while candidate in taken:
+        n += 1
+        candidate = f'{base}-{n}'
+    return candidate
+
+
+def copy_title(title):
+    max_length = Course._meta.get_field('title').max_length
+    return f'{title} (copy)'[:max_length]
+
+
+def clone_course(course, owner=None, title=None, slug=None,
+                 batch_size=BATCH_SIZE):
+    '''
+    Copies the course with its modules, contents and items, and returns the
+    copy. The students and their progress stay with the original.
+    '''
+    owner = owner or course.owner
+    clone = Course(owner=owner, subject_id=course.subject_id,
+                   title=title or copy_title(course.title),
+                   slug=slug or copy_slug(course.slug),
+                   overview=course.overview)
+
+    with transaction.atomic():
+        clone.save()
+        modules = list(course.modules.all())
+        copies = [Module(course=clone, title=module.title,
+                         description=module.description, order=module.order)
+                  for module in modules]
+        Module.objects.bulk_create(copies, batch_size=batch_size)
+        module_map = {module.id: copy.id
+                      for module, copy in zip(modules, copies)}
+
+        contents = list(Content.objects.filter(module__course=course)
+                                       .order_by())
+        object_ids = {}
+        for content in contents:
+            object_ids.setdefault(content.content_type_id, set()) \
+                      .add(content.object_id)
+
+        # (content type, old id) -> the copy of the item
+        item_map = {}
+        for content_type_id, ids in object_ids.items():
+            model = ContentType.objects.get_for_id(content_type_id) \
+                                       .model_class()
+            items = list(model.objects.filter(id__in=ids))
+            old_ids = [item.id for item in items]
+            for item in items:
+                item.pk = None
+                item._state.adding = True
+                item.owner = owner
+            model.objects.bulk_create(items, batch_size=batch_size)
+
+            if model in LINKED_TO_ITEM:
+                version = model.render_version()
+                for item in items:
+                    item.rendered = item.render_template()
+                    item.rendered_version = version
+                model.objects.bulk_update(
+                            items, ['rendered', 'rendered_version'],
+                            batch_size=batch_size)
+
+            for old_id, item in zip(old_ids, items):
+                item_map[content_type_id, old_id] = item.id
+
+        copied = []
+        for content in contents:
+            object_id = item_map.get((content.content_type_id,
+                                      content.object_id))
+            # Contents whose item is gone are not copied
+            if object_id is not None:
+                copied.append(Content(module_id=module_map[content.module_id],
+                                      content_type_id=content.content_type_id,
+                                      object_id=object_id,
+                                      order=content.order))
+        Content.objects.bulk_create(copied, batch_size=batch_size)
+
+        # bulk_create() does not send the signals the counters and the
+        # catalog rely on
+        catalog.bump_module(clone.subject_id)
+        clone.module_count = len(copies)
+        clone.content_count = len(copied)
+        Course.objects.filter(id=clone.id).update(
+                                module_count=clone.module_count,
+                                content_count=clone.content_count)
+    return clone
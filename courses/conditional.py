@@ -0,0 +1,92 @@
+import hashlib
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import Course
+
+'''
+Conditional GET for the course pages and the contents API.
+
+Course.content_version counts the changes of the course and of everything
+shown with it: modules, contents, items, the subject and the instructor.
+Course.updated is the time of the last one. The signal handlers in
+courses.signals call the touch functions in the transaction of the change.
+
+The views read both columns with one indexed lookup. A client that sends
+its ETag or date back in If-None-Match or If-Modified-Since gets a 304
+before anything else is loaded or rendered. The ETag also covers whatever
+else shapes the response, like the user or the version of the template.
+The responses are private and revalidated on every use.
+'''
+
+
+def touch(queryset):
+    queryset.update(content_version=F('content_version') + 1,
+                    updated=timezone.now())
+
+
+def touch_course(course_id):
+    touch(Course.objects.filter(pk=course_id))
+
+
+def touch_course_of_module(module_id):
+    touch(Course.objects.filter(modules__id=module_id))
+
+
+def touch_courses_of_item(item):
+    touch(Course.objects.filter(
+            modules__contents__content_type=ContentType.objects
+                                                       .get_for_model(item),
+            modules__contents__object_id=item.pk))
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.sha1('-'.join(str(part) for part in parts)
+                                   .encode()).hexdigest())
+
+
+def not_modified(request, etag, updated):
+    '''
+    Returns a 304 response when the copy of the client is current (or a 412
+    when an If-Match fails), otherwise None.
+    '''
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=int(updated.timestamp()))
+    if response is not None:
+        set_validators(response, etag, updated)
+    return response
+
+
+def set_validators(response, etag, updated):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(updated.timestamp())
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+'''
+For class-based views. get_version() returns the ETag and the time of the
+last change after one query, or None when the page cannot be served (the
+object does not exist, the user may not see it). The view then runs as
+usual and answers with its own error. Views that do not override it are
+served without validators.
+'''
+class ConditionalMixin:
+    def get_version(self):
+        return None
+
+    def get(self, request, *args, **kwargs):
+        version = self.get_version()
+        if version is None:
+            return super().get(request, *args, **kwargs)
+        etag, updated = version
+        response = not_modified(request, etag, updated)
+        if response is None:
+            response = set_validators(super().get(request, *args, **kwargs),
+                                      etag, updated)
+        return response
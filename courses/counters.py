@@ -0,0 +1,84 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Content, Course, Module, Subject
+
+'''
+Counter columns of the catalog: Subject.course_count and the module, content
+and student counts of Course.
+
+The signal handlers in courses.signals move them with F() updates in the
+transaction of the change, so the catalog reads them straight off the rows.
+Code that bypasses the signals (bulk_create, queryset deletes) has to call
+these functions itself. recount() computes every counter from scratch and
+fixes the rows that drifted, see the recount command.
+'''
+
+
+def add(model, pk, field, delta):
+    if delta:
+        model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def add_each(model, pks, field, delta):
+    model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
+
+
+def add_to_course_of_module(module_id, field, delta):
+    # One UPDATE, the course is looked up by the database
+    Course.objects.filter(modules__id=module_id) \
+                  .update(**{field: F(field) + delta})
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(queryset.filter(**{field: OuterRef('pk')})
+                                     .order_by()
+                                     .values(field)
+                                     .annotate(total=Count('*'))
+                                     .values('total'),
+                             output_field=IntegerField()), 0)
+
+
+def student_count():
+    return _count(Course.students.through.objects, 'course')
+
+
+def content_count():
+    return _count(Content.objects, 'module__course')
+
+
+def recount_contents(*course_ids):
+    Course.objects.filter(id__in=course_ids) \
+                  .update(content_count=content_count())
+
+
+def recount_students(*course_ids):
+    Course.objects.filter(id__in=course_ids) \
+                  .update(student_count=student_count())
+
+
+COUNTERS = {
+    Subject: lambda: {'course_count': _count(Course.objects, 'subject')},
+    Course: lambda: {'module_count': _count(Module.objects, 'course'),
+                     'content_count': content_count(),
+                     'student_count': student_count()},
+}
+
+
+def recount(dry_run=False):
+    '''
+    Returns {model: number of rows whose counters were wrong} and
+    fixes them unless dry_run is set.
+    '''
+    drift = {}
+    for model, counters in COUNTERS.items():
+        real = {f'real_{field}': value for field, value in counters().items()}
+        wrong = Q()
+        for field in counters():
+            wrong |= ~Q(**{field: F(f'real_{field}')})
+        ids = list(model.objects.annotate(**real).filter(wrong)
+                                .values_list('id', flat=True))
+        if ids and not dry_run:
+            model.objects.filter(id__in=ids).update(**counters())
+        drift[model] = len(ids)
+    return drift
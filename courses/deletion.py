@@ -0,0 +1,42 @@
+import threading
+from contextlib import contextmanager
+
+'''
+Deleting a course deletes its modules and contents with it, and Django
+sends post_delete for every one of those rows. The handlers that keep the
+counters, versions and caches of the course up to date would each run a
+query or two per row, thousands for a large course, only to update a
+course that is going away.
+
+Subject.delete(), Course.delete() and Module.delete() run inside
+cascade(). The pre_delete handlers mark the rows being deleted, and the
+handlers of the rows below a marked one leave their work to the handler of
+that row, which does it once. Queryset deletes are not marked and go row
+by row.
+'''
+
+_local = threading.local()
+
+
+@contextmanager
+def cascade():
+    outer = getattr(_local, 'marked', None) is not None
+    if not outer:
+        _local.marked = set()
+    try:
+        yield
+    finally:
+        # Also after a failed delete, the rows are still there then
+        if not outer:
+            _local.marked = None
+
+
+def mark(instance):
+    marked = getattr(_local, 'marked', None)
+    if marked is not None:
+        marked.add((type(instance), instance.pk))
+
+
+def is_deleted(model, pk):
+    marked = getattr(_local, 'marked', None)
+    return marked is not None and (model, pk) in marked
@@ -0,0 +1,122 @@
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+from . import counters
+from .models import Course
+
+'''
+Enrollment is stored in the Course.students join table. bulk_enroll() writes
+every missing (course, user) pair with one multi-row INSERT per batch
+instead of one course.students.add() per course and user. Conflicting rows
+are ignored, so a pair that is enrolled concurrently does not break the
+batch.
+
+Every user also has an enrollment index in the cache: the sorted tuple of
+the IDs of the courses they joined, stamped with the user's enrollment
+version. Changing a user's enrollment bumps the version once the
+transaction commits, and the next read rebuilds the index. Enrollment
+checks on the content delivery path read the index and run no SQL.
+
+The version is bumped in the default cache, so every web process only sees
+it through a cache they all share, memcached as in education.production or
+Redis. With a per-process cache the other workers keep their old index, a
+student who just enrolled gets a 404 from them. The courses.W001 check
+warns about such a cache, and the entries expire after
+ENROLLMENT_CACHE_TIMEOUT seconds so a missed bump heals on its own.
+'''
+
+Enrollment = Course.students.through
+BATCH_SIZE = 1000
+ENROLLMENT_TIMEOUT = getattr(settings, 'ENROLLMENT_CACHE_TIMEOUT', 3600)
+
+
+def bulk_enroll(course_ids, user_ids, batch_size=BATCH_SIZE):
+    course_ids = list(dict.fromkeys(course_ids))
+    user_ids = list(dict.fromkeys(user_ids))
+
+    with transaction.atomic():
+        found_courses = set(Course.objects.filter(id__in=course_ids)
+                                          .values_list('id', flat=True))
+        found_users = set(User.objects.filter(id__in=user_ids)
+                                      .values_list('id', flat=True))
+        existing = set(Enrollment.objects.filter(course_id__in=found_courses,
+                                                 user_id__in=found_users)
+                                         .values_list('course_id', 'user_id'))
+        rows = [Enrollment(course_id=course_id, user_id=user_id)
+                for course_id in found_courses
+                for user_id in found_users
+                if (course_id, user_id) not in existing]
+        Enrollment.objects.bulk_create(rows, batch_size=batch_size,
+                                       ignore_conflicts=True)
+        # bulk_create() does not send m2m_changed
+        invalidate(*found_users)
+        counters.recount_students(*found_courses)
+
+    already = {}
+    for course_id, user_id in existing:
+        already[course_id] = already.get(course_id, 0) + 1
+
+    results = []
+    for course_id in course_ids:
+        if course_id not in found_courses:
+            results.append({'course': course_id, 'error': 'Not found.'})
+            continue
+        results.append({'course': course_id,
+                        'enrolled': len(found_users) - already.get(course_id, 0),
+                        'already_enrolled': already.get(course_id, 0)})
+
+    return {'results': results,
+            'unknown_users': [id for id in user_ids if id not in found_users]}
+
+
+def _version_key(user_id):
+    return f'enrollment:version:{user_id}'
+
+
+def _index_key(user_id):
+    return f'enrollment:courses:{user_id}'
+
+
+def enrolled_course_ids(user_id):
+    if user_id is None:
+        return ()
+    version_key = _version_key(user_id)
+    index_key = _index_key(user_id)
+    found = cache.get_many([version_key, index_key])
+    version = found.get(version_key)
+    if version is None:
+        # Start from the clock so an evicted version is never reused
+        cache.add(version_key, time.time_ns(), ENROLLMENT_TIMEOUT)
+        version = cache.get(version_key)
+
+    entry = found.get(index_key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    course_ids = tuple(sorted(Enrollment.objects.filter(user_id=user_id)
+                                            .values_list('course_id', flat=True)))
+    cache.set(index_key, (version, course_ids), ENROLLMENT_TIMEOUT)
+    return course_ids
+
+
+def is_enrolled(user_id, course_id):
+    course_ids = enrolled_course_ids(user_id)
+    i = bisect_left(course_ids, course_id)
+    return i < len(course_ids) and course_ids[i] == course_id
+
+
+def _bump(user_ids):
+    for user_id in user_ids:
+        # A new version rather than incr(), which keeps the old expiry
+        cache.set(_version_key(user_id), time.time_ns(), ENROLLMENT_TIMEOUT)
+
+
+def invalidate(*user_ids):
+    # Wait for the commit, otherwise a concurrent read could rebuild the
+    # index from the old rows and stamp it with the new version
+    transaction.on_commit(lambda: _bump(user_ids))
@@ -0,0 +1,100 @@
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Content, File, Image, Text, Video
+
+'''
+Streaming export of a course as JSON.
+
+Modules and contents are read with QuerySet.iterator(), which uses
+server-side cursors on PostgreSQL, and the document is produced piece by
+piece. The items of a module are loaded in chunks, one query per content
+type and chunk. Memory use does not depend on the size of the course, and
+the first bytes go out before the course has been read.
+
+The output is the format read by "manage.py import_courses":
+
+    {"title": ..., "slug": ..., "subject": "<subject slug>",
+     "overview": ..., "modules": [
+        {"order": ..., "title": ..., "description": ..., "contents": [
+            {"order": ..., "type": "text", "title": ..., "content": ...},
+            {"order": ..., "type": "video", "title": ..., "url": ...},
+            {"order": ..., "type": "image", "title": ..., "file": ...},
+            {"order": ..., "type": "file", "title": ..., "file": ...}]}]}
+'''
+
+CHUNK_SIZE = 500
+
+# The fields exported for every content type besides the title
+ITEM_FIELDS = {
+    Text: 'content',
+    Video: 'url',
+    Image: 'file',
+    File: 'file',
+}
+
+
+def dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+def _items(content_rows):
+    # Load the items of a chunk of contents, one query per content type
+    by_type = {}
+    for row in content_rows:
+        by_type.setdefault(row['content_type__model'], []).append(row['object_id'])
+
+    items = {}
+    for model, field in ITEM_FIELDS.items():
+        ids = by_type.get(model._meta.model_name)
+        if not ids:
+            continue
+        for item in model.objects.filter(id__in=ids).values('id', 'title', field):
+            items[model._meta.model_name, item['id']] = item
+    return items
+
+
+def _contents(module_id):
+    rows = Content.objects.filter(module_id=module_id) \
+                          .order_by('order', 'id') \
+                          .values('order', 'object_id', 'content_type__model') \
+                          .iterator(chunk_size=CHUNK_SIZE)
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            return
+        items = _items(chunk)
+        for row in chunk:
+            model_name = row['content_type__model']
+            item = items.get((model_name, row['object_id']))
+            if item is None:
+                # Dangling content, its item is gone
+                continue
+            data = {'order': row['order'], 'type': model_name}
+            data.update((key, value) for key, value in item.items()
+                        if key != 'id')
+            yield data
+
+
+def export_course(course):
+    header = {'title': course.title,
+              'slug': course.slug,
+              'subject': course.subject.slug,
+              'overview': course.overview,
+              'created': course.created,
+              'owner': course.owner.username}
+    yield dumps(header)[:-1] + ', "modules": ['
+
+    modules = course.modules.order_by('order', 'id') \
+                            .values('id', 'order', 'title', 'description') \
+                            .iterator(chunk_size=CHUNK_SIZE)
+    for i, module in enumerate(modules):
+        module_id = module.pop('id')
+        yield (', ' if i else '') + dumps(module)[:-1] + ', "contents": ['
+        for j, content in enumerate(_contents(module_id)):
+            yield (', ' if j else '') + dumps(content)
+        yield ']}'
+
+    yield ']}'
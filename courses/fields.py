@@ -1,14 +1,24 @@
-from django.db import models
+from bisect import bisect_left
+
+from django.db import connections, models, router
+from django.db.models import Max
 from django.core.exceptions import ObjectDoesNotExist
 
 class OrderField(models.PositiveIntegerField):
-    def __init__(self, for_fields=None, *args, **kwargs):
+    def __init__(self, for_fields=None, gap=None, *args, **kwargs):
         self.for_fields = for_fields
+        # Space between the keys of neighbouring items, enables sparse mode
+        self.gap = gap
         super().__init__(*args, **kwargs)
 
     def pre_save(self, model_instance, add):
         if getattr(model_instance, self.attname) is None:
             # When there is no current value
+            if self.gap:
+                value = self.allocate(model_instance)
+                setattr(model_instance, self.attname, value)
+                return value
+
             try:
                 qs = self.model.objects.all()
                 if self.for_fields:
@@ -16,7 +26,7 @@ class OrderField(models.PositiveIntegerField):
                     # for the fields in "for_fields"
                     query = {field: getattr(model_instance, field) for field in self.for_fields}
                     qs  = qs.filter(**query)
-                
+
                 # Get the order for the last item
                 last_item = qs.latest(self.attname)
                 value = last_item.order +1
@@ -36,3 +46,114 @@ class OrderField(models.PositiveIntegerField):
         hardcoding data that depends on a specific model or field. Your
         field should work in any model.
         '''
+
+    '''
+    Sparse mode (gap=N)
+
+    Items get keys N, 2N, 3N... instead of 0, 1, 2. A new key is the largest
+    key of its group of siblings plus N, read while the parent rows of the
+    group (the related rows of for_fields) are locked with SELECT ... FOR NO
+    KEY UPDATE. The lock is held until the transaction commits, so the
+    saves of two processes into the same group take their turn and never
+    get the same key. The model saves inside a transaction for that, see
+    OrderedMixin in courses/models.py; outside of one there is no lock.
+
+    Because of the gaps, moving an item only rewrites the key of that item:
+    it gets a key between its new neighbours. When two neighbours have no
+    free key left between them the whole group is spread out again.
+    '''
+    def group_values(self, model_instance):
+        fields = [self.model._meta.get_field(field).attname
+                  for field in self.for_fields or []]
+        return {field: getattr(model_instance, field) for field in fields}
+
+    def lock_group(self, model_instance, using):
+        for name in self.for_fields or []:
+            field = self.model._meta.get_field(name)
+            if field.is_relation:
+                list(field.related_model._default_manager.using(using)
+                          .select_for_update(no_key=True)
+                          .filter(pk=getattr(model_instance, field.attname))
+                          .values_list('pk'))
+
+    def allocate(self, model_instance):
+        using = router.db_for_write(self.model, instance=model_instance)
+        if connections[using].in_atomic_block:
+            self.lock_group(model_instance, using)
+        qs = self.model._default_manager.using(using).filter(
+                                    **self.group_values(model_instance))
+        last = qs.aggregate(last=Max(self.attname))['last'] or 0
+        return last + self.gap
+
+    def respace(self, keys):
+        '''
+        Takes the current keys of a group in their new order and returns
+        the new keys, leaving as many keys untouched as possible. Returns
+        None when there is no room left between two neighbours.
+        '''
+        keep = longest_increasing(keys)
+        new = list(keys)
+        i = 0
+        while i < len(new):
+            if i in keep:
+                i += 1
+                continue
+            # A run of moved items between two items that stay put
+            j = i
+            while j < len(new) and j not in keep:
+                j += 1
+            low = new[i - 1] if i > 0 else -1
+            if j == len(new):
+                step = self.gap
+            else:
+                step = (new[j] - low) // (j - i + 1)
+                if step < 1:
+                    return None
+            for k in range(i, j):
+                new[k] = low + step * (k - i + 1)
+            i = j
+        return new
+
+    def spread(self, count):
+        return [self.gap * (i + 1) for i in range(count)]
+
+    def reorder(self, objs):
+        '''
+        Sets the keys of the objects of one group so they sort in the
+        given order and returns the objects whose key changed.
+        '''
+        keys = [getattr(obj, self.attname) for obj in objs]
+        if self.gap:
+            new = self.respace(keys) or self.spread(len(keys))
+        else:
+            new = list(range(len(keys)))
+
+        changed = []
+        for obj, old, value in zip(objs, keys, new):
+            if old != value:
+                setattr(obj, self.attname, value)
+                changed.append(obj)
+        return changed
+
+
+def longest_increasing(keys):
+    # Indices of a longest strictly increasing subsequence, O(n log n)
+    tails = []
+    tail_indices = []
+    previous = [None] * len(keys)
+    for i, key in enumerate(keys):
+        pos = bisect_left(tails, key)
+        if pos == len(tails):
+            tails.append(key)
+            tail_indices.append(i)
+        else:
+            tails[pos] = key
+            tail_indices[pos] = i
+        previous[i] = tail_indices[pos - 1] if pos else None
+
+    keep = set()
+    i = tail_indices[-1] if tail_indices else None
+    while i is not None:
+        keep.add(i)
+        i = previous[i]
+    return keep
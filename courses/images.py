@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.db.models.fields.json import KeyTextTransform
+from PIL import Image as PILImage
+from PIL import ImageOps, UnidentifiedImageError
+
+'''
+Resized copies of Image content for small screens.
+
+The generate_image_derivatives command writes copies of an image at the
+widths in IMAGE_DERIVATIVE_WIDTHS that are narrower than the original, in a
+pool of worker processes. The copies are named after the SHA-256 of the
+original, so an image uploaded twice is only resized once. When they are
+done, their names are stored on the Image, which is then re-rendered with a
+srcset. Images keep their transparency: the copies of images with an alpha
+channel are PNG, the others JPEG.
+
+The Image rows are the queue: an image whose derivatives were not made for
+its current file is pending (pending()), so nothing is lost when a process
+restarts. Run the command with --loop next to the web processes; until it
+gets to an image, the pages show the original without a srcset.
+'''
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (320, 640, 1280))
+QUALITY = getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80)
+
+# Modes that carry transparency, in whole or through a palette entry
+ALPHA_MODES = ('RGBA', 'LA', 'PA')
+
+
+def derivative_name(digest, width, extension='jpg'):
+    return f'derivatives/{digest[:2]}/{digest}_{width}.{extension}'
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def has_alpha(image):
+    return image.mode in ALPHA_MODES or 'transparency' in image.info
+
+
+def generate(path, media_root, widths=WIDTHS, quality=QUALITY):
+    '''
+    Writes the derivatives of the image at path and returns {width: name}.
+    Runs in the worker processes, so it must not touch the database.
+    '''
+    digest = file_digest(path)
+    derivatives = {}
+    try:
+        with PILImage.open(path) as original:
+            image = ImageOps.exif_transpose(original)
+            if has_alpha(image):
+                image = image.convert('RGBA')
+                extension, options = 'png', {'optimize': True}
+            else:
+                image = image.convert('RGB')
+                extension, options = 'jpg', {'quality': quality,
+                                             'optimize': True,
+                                             'progressive': True}
+    except (UnidentifiedImageError, OSError):
+        logger.warning('Not an image, no derivatives for %s', path)
+        return derivatives
+
+    for width in sorted(widths):
+        if width >= image.width:
+            break
+        name = derivative_name(digest, width, extension)
+        target = os.path.join(media_root, name)
+        if not os.path.exists(target):
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), PILImage.Resampling.LANCZOS)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Write next to the target and rename, readers never see
+            # half-written files
+            tmp = f'{target}.{os.getpid()}.tmp'
+            resized.save(tmp, 'PNG' if extension == 'png' else 'JPEG',
+                         **options)
+            os.replace(tmp, target)
+        derivatives[str(width)] = name
+    return derivatives
+
+
+def pending():
+    from .models import Image
+
+    # Derivatives never made, or made for a file that was replaced since
+    return Image.objects.exclude(file='') \
+                .annotate(source=KeyTextTransform('source', 'derivatives')) \
+                .filter(Q(source__isnull=True) | ~Q(source=F('file')))
+
+
+def store(image_id, source, derivatives):
+    from . import conditional
+    from .models import Image
+
+    image = Image.objects.filter(id=image_id, file=source).first()
+    if image is None:
+        # Deleted, or another file was uploaded in the meantime
+        return
+    image.derivatives = {'source': source, 'widths': derivatives}
+    Image.objects.filter(id=image_id).update(derivatives=image.derivatives)
+    image.update_rendered()
+    # The srcset changed the rendered HTML
+    conditional.touch_courses_of_item(image)
@@ -0,0 +1,179 @@
+import json
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import DataError, IntegrityError, models, transaction
+
+from . import catalog
+from .export import ITEM_FIELDS
+from .models import ORDER_GAP, Content, Course, Module, Subject
+
+'''
+Bulk import of courses in the format written by courses.export.
+
+Every course goes in with one transaction and a handful of queries: the
+course itself, then one bulk_create per batch of modules, of items of each
+content type and of contents. Order keys are assigned up front, so
+OrderField does not run per row. Primary keys come back from the bulk
+inserts, which requires PostgreSQL, and the HTML of the items is rendered
+once they have them and written with one bulk_update per batch instead of
+ItemBase.save().
+
+Files are not imported, a File or Image refers to a blob that is already in
+the content storage, by its name in the export.
+'''
+
+BATCH_SIZE = 500
+
+ITEM_MODELS = {model._meta.model_name: model for model in ITEM_FIELDS}
+
+
+class CourseImportError(ValueError):
+    pass
+
+
+def course_field(data, name):
+    # For the messages about a course, which may not even be an object
+    return data.get(name) if isinstance(data, dict) else None
+
+
+def _text(line):
+    return line.decode() if isinstance(line, bytes) else line
+
+
+def read_courses(stream):
+    '''
+    Yields the courses of a JSON lines stream, one course per line, or of a
+    JSON document holding a course or a list of courses. JSON lines are
+    read one line at a time, so any number of courses can be imported.
+    '''
+    first = _text(stream.readline())
+    while first and not first.strip():
+        first = _text(stream.readline())
+    if not first:
+        return
+
+    try:
+        data = json.loads(first)
+    except ValueError:
+        # A document spread over several lines
+        data = None
+
+    if isinstance(data, dict):
+        yield data
+        line = _text(stream.readline())
+        while line:
+            if line.strip():
+                yield json.loads(line)
+            line = _text(stream.readline())
+    else:
+        data = json.loads(first + _text(stream.read()))
+        yield from data if isinstance(data, list) else [data]
+
+
+class CourseImporter:
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.subjects = {}
+        self.stats = {'courses': 0, 'modules': 0, 'items': 0, 'seconds': 0.0}
+
+    def get_subject(self, slug):
+        if slug not in self.subjects:
+            try:
+                self.subjects[slug] = Subject.objects.get(slug=slug)
+            except Subject.DoesNotExist:
+                raise CourseImportError(f'Unknown subject "{slug}".')
+        return self.subjects[slug]
+
+    def build_item(self, data, owner):
+        model = ITEM_MODELS.get(data.get('type'))
+        if model is None:
+            raise CourseImportError(
+                            f'Unknown content type "{data.get("type")}".')
+        field = ITEM_FIELDS[model]
+        if not data.get(field):
+            raise CourseImportError(
+                            f'A {model._meta.model_name} needs a "{field}".')
+        value = data[field]
+        model_field = model._meta.get_field(field)
+        if isinstance(model_field, models.FileField) and \
+                not model_field.storage.is_blob(value):
+            # Only files already stored for content, the name must not
+            # reach the uploads in progress or any other file
+            raise CourseImportError(f'Unknown file "{value}".')
+        return model(owner=owner, title=data.get('title', ''),
+                     **{field: value})
+
+    def import_course(self, data, owner):
+        start = time.monotonic()
+        if not isinstance(data, dict):
+            raise CourseImportError('A course must be a JSON object.')
+        try:
+            subject = self.get_subject(data['subject'])
+            course = Course(owner=owner, subject=subject, title=data['title'],
+                            slug=data['slug'], overview=data.get('overview', ''))
+            modules_data = sorted(data.get('modules', []),
+                                  key=lambda module: module.get('order', 0))
+
+            # Build every module and item first, then insert them type by type
+            modules = []
+            items = {model: [] for model in ITEM_FIELDS}
+            placed = []
+            for i, module_data in enumerate(modules_data):
+                module = Module(title=module_data['title'],
+                                description=module_data.get('description', ''),
+                                order=(i + 1) * ORDER_GAP)
+                modules.append(module)
+                contents = sorted(module_data.get('contents', []),
+                                  key=lambda content: content.get('order', 0))
+                for j, content_data in enumerate(contents):
+                    item = self.build_item(content_data, owner)
+                    items[type(item)].append(item)
+                    placed.append((module, (j + 1) * ORDER_GAP, item))
+        except (KeyError, TypeError, AttributeError) as e:
+            raise CourseImportError(f'Malformed course: {e!r}')
+        if Course.objects.filter(slug=course.slug).exists():
+            raise CourseImportError(
+                            f'A course with the slug "{course.slug}" exists.')
+
+        try:
+            with transaction.atomic():
+                self.insert(course, modules, items, placed)
+        except (DataError, IntegrityError) as e:
+            # A value too long for its column, or a slug taken meanwhile
+            raise CourseImportError(f'Invalid course: {str(e).splitlines()[0]}')
+
+        self.stats['courses'] += 1
+        self.stats['modules'] += len(modules)
+        self.stats['items'] += len(placed)
+        self.stats['seconds'] += time.monotonic() - start
+        return course
+
+    def insert(self, course, modules, items, placed):
+        course.save()
+        for module in modules:
+            module.course = course
+        Module.objects.bulk_create(modules, batch_size=self.batch_size)
+
+        for model, objs in items.items():
+            model.objects.bulk_create(objs, batch_size=self.batch_size)
+            # The File and Image templates link to the item by id
+            for item in objs:
+                item.rendered = item.render_template()
+                item.rendered_version = model.render_version()
+            model.objects.bulk_update(objs, ['rendered', 'rendered_version'],
+                                      batch_size=self.batch_size)
+
+        contents = [Content(module=module,
+                            content_type=ContentType.objects.get_for_model(item),
+                            object_id=item.pk,
+                            order=order)
+                    for module, order, item in placed]
+        Content.objects.bulk_create(contents, batch_size=self.batch_size)
+        # bulk_create() does not send the signals the catalog relies on
+        catalog.bump_module(course.subject_id)
+        course.module_count = len(modules)
+        course.content_count = len(contents)
+        Course.objects.filter(id=course.id).update(
+                            module_count=course.module_count,
+                            content_count=course.content_count)
@@ -0,0 +1,128 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import uuid
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from django.utils import timezone
+
+from courses import bench
+
+
+class Command(BaseCommand):
+    help = ('Time the hot pages against a synthetic dataset in a test '
+            'database and write a JSON report')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subjects', type=int, default=5)
+        parser.add_argument('--courses', type=int, default=50)
+        parser.add_argument('--modules', type=int, default=5,
+                            help='Modules per course')
+        parser.add_argument('--contents', type=int, default=10,
+                            help='Contents per module')
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--enrollments', type=int, default=5,
+                            help='Courses per student')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='*',
+                            help='Names of the endpoints to measure')
+        parser.add_argument('-o', '--output',
+                            help='Write the report to this file')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database between runs')
+        parser.add_argument('--compare', metavar='REPORT',
+                            help='Compare with an earlier report')
+
+    def handle(self, *args, **options):
+        before = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                before = json.load(f)
+
+        # The configured cache backend, under keys of this run only
+        caches = {alias: {**config, 'KEY_PREFIX': f'bench-{uuid.uuid4().hex}'}
+                  for alias, config in settings.CACHES.items()}
+
+        media_root = tempfile.mkdtemp(prefix='bench-media-')
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           keepdb=options['keepdb'])
+        try:
+            with override_settings(CACHES=caches, MEDIA_ROOT=media_root):
+                report = self.bench(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0,
+                                                keepdb=options['keepdb'])
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        if before is not None:
+            report['compare'] = bench.compare(before, report)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            if before is not None:
+                self.write_comparison(report['compare'])
+        else:
+            self.stdout.write(output)
+
+    def write_comparison(self, comparison):
+        # Requests per second of one client in turn, not of the server
+        self.stdout.write(f'{"endpoint":<24}{"serial req/s before":>22}'
+                          f'{"after":>10}{"speedup":>10}')
+        for name, numbers in comparison.items():
+            self.stdout.write(f'{name:<24}'
+                              f'{numbers["serial_rps_before"] or "-":>22}'
+                              f'{numbers["serial_rps_after"]:>10}'
+                              f'{numbers.get("speedup", "-"):>10}')
+
+    def bench(self, options):
+        from courses.models import Course
+        if options['keepdb'] and Course.objects.exists():
+            dataset = None
+        else:
+            dataset = bench.build_dataset(
+                            subjects=options['subjects'],
+                            courses=options['courses'],
+                            modules=options['modules'],
+                            contents=options['contents'],
+                            students=options['students'],
+                            enrollments=options['enrollments'],
+                            seed=options['seed'])
+        return {'created': timezone.now().isoformat(),
+                'commit': self.commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'settings': os.environ.get('DJANGO_SETTINGS_MODULE'),
+                'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                'cache': settings.CACHES['default']['BACKEND'],
+                'dataset': dataset,
+                'endpoints': bench.run(requests=options['requests'],
+                                       warmup=options['warmup'],
+                                       seed=options['seed'],
+                                       only=options['only'])}
+
+    def commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                                  capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
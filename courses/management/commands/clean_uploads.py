@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from courses import uploads
+from courses.models import Upload
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked uploads that were not touched for a while'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24,
+                            help='Age of the last chunk, default 24')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        total = 0
+        for upload in Upload.objects.filter(updated__lt=cutoff).iterator():
+            uploads.abort(upload)
+            total += 1
+        self.stdout.write(f'Deleted {total} abandoned uploads')
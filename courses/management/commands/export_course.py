@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.export import export_course
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Export courses as JSON lines, one course per line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='+', type=int)
+        parser.add_argument('-o', '--output',
+                            help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.select_related('subject', 'owner') \
+                                .in_bulk(options['course_ids'])
+        missing = set(options['course_ids']) - set(courses)
+        if missing:
+            raise CommandError(f'Unknown courses: {sorted(missing)}')
+
+        out = open(options['output'], 'w') if options['output'] else None
+        write = out.write if out else \
+                        lambda chunk: self.stdout.write(chunk, ending='')
+        try:
+            for course_id in options['course_ids']:
+                for chunk in export_course(courses[course_id]):
+                    write(chunk)
+                write('\n')
+        finally:
+            if out:
+                out.close()
@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from courses import images
+from courses.models import Image
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized copies of Image content'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate the copies of every image')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes '
+                                 '(default: one per CPU)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and generate the copies of '
+                                 'new images')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='Seconds between two rounds, with --loop')
+
+    def handle(self, *args, **options):
+        queryset = Image.objects.exclude(file='') if options['all'] \
+                                                  else images.pending()
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                done = self.generate(executor, queryset)
+                if done or not options['loop']:
+                    self.stdout.write(f'Generated the copies of {done} images')
+                if not options['loop']:
+                    break
+                # --all only once, then what comes in
+                queryset = images.pending()
+                time.sleep(options['interval'])
+
+    def generate(self, executor, queryset):
+        storage = Image._meta.get_field('file').storage
+        futures = [(id, name, executor.submit(images.generate,
+                                              storage.path(name),
+                                              settings.MEDIA_ROOT))
+                   for id, name in queryset.order_by('id')
+                                           .values_list('id', 'file')]
+        for id, name, future in futures:
+            try:
+                derivatives = future.result()
+            except Exception as e:
+                # Stored without copies, so it is not tried over and over
+                self.stderr.write(f'Image {id}: {e!r}')
+                derivatives = {}
+            images.store(id, name, derivatives)
+        return len(futures)
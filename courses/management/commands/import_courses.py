@@ -0,0 +1,46 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.importer import (CourseImporter, CourseImportError,
+                              course_field, read_courses)
+
+
+class Command(BaseCommand):
+    help = 'Import courses from a JSON or JSON lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--owner',
+                            help='Username of the owner of the imported '
+                                 'courses, defaults to the "owner" field')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def get_owner(self, username):
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f'Unknown user "{username}".')
+
+    def handle(self, *args, **options):
+        importer = CourseImporter(batch_size=options['batch_size'])
+        owner = self.get_owner(options['owner']) if options['owner'] else None
+        failed = 0
+
+        with open(options['path'], 'rb') as stream:
+            for data in read_courses(stream):
+                try:
+                    course = importer.import_course(
+                        data,
+                        owner or self.get_owner(course_field(data, 'owner')))
+                except CourseImportError as e:
+                    failed += 1
+                    self.stderr.write(f'{course_field(data, "slug")}: {e}')
+                    continue
+                self.stdout.write(f'Imported "{course.title}"')
+
+        stats = importer.stats
+        rate = stats['items'] / stats['seconds'] if stats['seconds'] else 0
+        self.stdout.write(
+            f'{stats["courses"]} courses, {stats["modules"]} modules and '
+            f'{stats["items"]} items imported in {stats["seconds"]:.2f}s '
+            f'({rate:.0f} items/s), {failed} failed')
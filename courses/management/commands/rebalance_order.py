@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from courses.models import Content, Module
+
+'''
+Spreads out the order keys of modules and contents again. Moving items
+around keeps halving the room between neighbours, run this periodically
+(e.g. from cron) so drags rarely have to rebalance a whole group inline.
+'''
+
+
+class Command(BaseCommand):
+    help = 'Spread out crowded module and content order keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-gap', type=int, default=16,
+                            help='Rebalance groups with neighbours closer '
+                                 'than this (default: 16)')
+
+    def handle(self, *args, **options):
+        for model, group in ((Module, 'course_id'), (Content, 'module_id')):
+            rows = model.objects.order_by(group, 'order', 'id') \
+                                .values_list(group, 'id', 'order')
+            total = 0
+            items, last_group = [], None
+            # Rows come sorted by group, handle one group at a time
+            for group_id, id, order in rows.iterator():
+                if group_id != last_group:
+                    total += self.rebalance(model, group, last_group, items,
+                                            options['min_gap'])
+                    items, last_group = [], group_id
+                items.append((id, order))
+            total += self.rebalance(model, group, last_group, items,
+                                    options['min_gap'])
+            self.stdout.write(f'{model._meta.verbose_name}: '
+                              f'rebalanced {total} groups')
+
+    def rebalance(self, model, group, group_id, items, min_gap):
+        keys = [order for id, order in items]
+        if all(b - a >= min_gap for a, b in zip(keys, keys[1:])):
+            return 0
+        field = model._meta.get_field('order')
+        objs = [model(id=id, order=value, **{group: group_id})
+                for (id, order), value in zip(items, field.spread(len(items)))]
+        with transaction.atomic():
+            model.objects.bulk_update(objs, ['order'], batch_size=1000)
+        return 1
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from courses import catalog, counters
+from courses.models import Subject
+
+
+class Command(BaseCommand):
+    help = 'Recompute the counter columns of subjects and courses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the rows that are wrong')
+
+    def handle(self, *args, **options):
+        drift = counters.recount(dry_run=options['dry_run'])
+        for model, count in drift.items():
+            self.stdout.write(f'{model._meta.verbose_name_plural}: '
+                              f'{count} rows with wrong counts')
+        if any(drift.values()) and not options['dry_run']:
+            catalog.bump_course(*Subject.objects.values_list('id', flat=True))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import File, Image, Text, Video
+
+
+class Command(BaseCommand):
+    help = 'Re-render the stored HTML of content items after template changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Re-render every item, not only stale ones')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model in (Text, Video, Image, File):
+            items = model.objects.order_by('id')
+            if not options['all']:
+                items = items.exclude(rendered_version=model.render_version())
+
+            batch, total = [], 0
+            for item in items.iterator(chunk_size=options['batch_size']):
+                item.rendered = item.render_template()
+                item.rendered_version = model.render_version()
+                batch.append(item)
+                if len(batch) >= options['batch_size']:
+                    total += self.flush(model, batch)
+            total += self.flush(model, batch)
+            self.stdout.write(f'{model._meta.verbose_name}: '
+                              f're-rendered {total} items')
+
+    def flush(self, model, batch):
+        model.objects.bulk_update(batch, ['rendered', 'rendered_version'])
+        count = len(batch)
+        batch.clear()
+        return count
@@ -0,0 +1,180 @@
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+'''
+Delivery of the files of File and Image content.
+
+serve_file() answers conditional requests (If-None-Match,
+If-Modified-Since) and single byte ranges, so an interrupted download can be
+resumed. The file object handed to FileResponse keeps its file descriptor,
+so servers with a wsgi.file_wrapper that uses sendfile(), like gunicorn,
+send the bytes without copying them through Python.
+
+With CONTENT_MEDIA_ACCEL set, the transfer is handed to the front proxy
+instead, which then also deals with the ranges:
+
+    'nginx'   X-Accel-Redirect: <CONTENT_MEDIA_ACCEL_PREFIX><file name>
+              with an internal location aliased to MEDIA_ROOT
+    'apache'  X-Sendfile: <absolute path> (mod_xsendfile)
+
+Clients without a session, e.g. the API clients, are given signed URLs
+(signed_media_url) that expire after CONTENT_MEDIA_URL_MAX_AGE seconds. The
+contents API points the links of the pre-rendered HTML at them with
+sign_links(), and its ETag changes every half of that time
+(signing_window), so a body revalidated with a 304 still has links that
+work for at least that long.
+'''
+
+MEDIA_ACCEL = getattr(settings, 'CONTENT_MEDIA_ACCEL', None)
+MEDIA_ACCEL_PREFIX = getattr(settings, 'CONTENT_MEDIA_ACCEL_PREFIX',
+                             '/protected-media/')
+MEDIA_URL_MAX_AGE = getattr(settings, 'CONTENT_MEDIA_URL_MAX_AGE', 3600)
+
+SIGNING_SALT = 'courses.media'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    '''
+    File-like object for a slice of a file. read() stops at the end of the
+    slice, and the descriptor is positioned at its start for sendfile().
+    '''
+    def __init__(self, path, start, length):
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    '''
+    Returns the (start, end) of a single byte range, end included, None
+    when the whole file has to be sent and raises ValueError when the range
+    cannot be satisfied.
+    '''
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        # Missing, malformed or multiple ranges: send everything
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # The last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range.')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable.')
+    return start, end
+
+
+def signed_media_url(model_name, item_id, user_id):
+    token = signing.TimestampSigner(salt=SIGNING_SALT) \
+                   .sign(f'{model_name}:{item_id}:{user_id}')
+    url = reverse('content_media', args=[model_name, item_id])
+    return f'{url}?token={token}'
+
+
+def sign_links(html, model_name, item_id, user_id):
+    '''
+    Replaces the links of the HTML of an item to its media, the file or the
+    resized copies of an image (?w=), with signed URLs for the user.
+    '''
+    url = reverse('content_media', args=[model_name, item_id])
+    signed = signed_media_url(model_name, item_id, user_id)
+    return html.replace(f'{url}?', f'{signed}&amp;').replace(f'{url}"',
+                                                              f'{signed}"')
+
+
+def signing_window():
+    return int(time.time()) // max(MEDIA_URL_MAX_AGE // 2, 1)
+
+
+def check_token(token, model_name, item_id):
+    # Returns the id of the user the URL was signed for, or None
+    try:
+        value = signing.TimestampSigner(salt=SIGNING_SALT) \
+                       .unsign(token, max_age=MEDIA_URL_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    signed_model, signed_id, user_id = value.split(':')
+    if signed_model != model_name or signed_id != str(item_id):
+        return None
+    return int(user_id)
+
+
+def serve_file(request, storage, name):
+    path = storage.path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    size = stat.st_size
+    etag = quote_etag(f'{size:x}-{int(stat.st_mtime):x}')
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, name, path, size, etag,
+                                  last_modified)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _file_response(request, name, path, size, etag, last_modified):
+    if MEDIA_ACCEL == 'nginx':
+        response = HttpResponse(content_type='')
+        response['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX + name
+        return response
+    if MEDIA_ACCEL == 'apache':
+        response = HttpResponse(content_type='')
+        response['X-Sendfile'] = path
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    # A stale If-Range means the client's partial copy is outdated
+    if not if_range or if_range in (etag, http_date(last_modified)):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    response = FileResponse(RangeFile(path, start, length),
+                            filename=os.path.basename(name))
+    response['Content-Length'] = length
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.10 on 2026-10-18 04:55
+
+import courses.fields
+from django.db import migrations
+
+ORDER_GAP = 1024
+
+
+def spread_orders(apps, schema_editor):
+    # Give existing modules and contents sparse keys, keeping their order
+    for model_name, group in (('Module', 'course_id'), ('Content', 'module_id')):
+        model = apps.get_model('courses', model_name)
+        changed = []
+        last_group, position = None, 0
+        for obj in model.objects.order_by(group, 'order', 'id'):
+            if getattr(obj, group) != last_group:
+                last_group, position = getattr(obj, group), 0
+            position += 1
+            obj.order = position * ORDER_GAP
+            changed.append(obj)
+        model.objects.bulk_update(changed, ['order'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_course_students'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='content',
+            name='order',
+            field=courses.fields.OrderField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='module',
+            name='order',
+            field=courses.fields.OrderField(blank=True),
+        ),
+        migrations.RunPython(spread_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.10 on 2026-10-18 05:14
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(queryset.filter(**{field: OuterRef('pk')})
+                                     .order_by()
+                                     .values(field)
+                                     .annotate(total=Count('*'))
+                                     .values('total'),
+                             output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Subject = apps.get_model('courses', 'Subject')
+    Course = apps.get_model('courses', 'Course')
+    Module = apps.get_model('courses', 'Module')
+    Content = apps.get_model('courses', 'Content')
+    Subject.objects.update(course_count=_count(Course.objects, 'subject'))
+    Course.objects.update(
+        module_count=_count(Module.objects, 'course'),
+        content_count=_count(Content.objects, 'module__course'),
+        student_count=_count(Course.students.through.objects, 'course'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_content_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='content_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='module_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='student_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='course_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,16 +1,62 @@
+import uuid
+
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import models, transaction
 from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
 
+from . import deletion
 from .fields import OrderField
+from .rendering import template_version
+from .storage import content_storage
+
+# Distance between the order keys of neighbouring modules and contents
+ORDER_GAP = 1024
+
+
+'''
+The counter columns are only written with F() updates, see courses/counters.py.
+A save() of an instance loaded before such an update must not write the old
+counts back, so saving an existing row leaves them out.
+'''
+class CountersMixin:
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields]
+        super().save(*args, **kwargs)
+
+
+# Deletes the rows below in one go, see courses/deletion.py
+class CascadeMixin:
+    def delete(self, *args, **kwargs):
+        with deletion.cascade():
+            return super().delete(*args, **kwargs)
+
+
+# New order keys are allocated under a lock on the parent row that is held
+# until the row is inserted, see OrderField
+class OrderedMixin:
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
 
 # Create your models here.
-class Subject(models.Model):
+class Subject(CascadeMixin, CountersMixin, models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
+    course_count = models.IntegerField(default=0, editable=False)
+
+    counter_fields = ('course_count',)
 
     class Meta:
         ordering = ['title']
@@ -19,7 +65,7 @@ class Subject(models.Model):
         return self.title
 
 
-class Course(models.Model):
+class Course(CascadeMixin, CountersMixin, models.Model):
     owner = models.ForeignKey(User,
                                 related_name='courses_created',
                                 on_delete=models.CASCADE)
@@ -32,6 +78,16 @@ class Course(models.Model):
     slug = models.SlugField(max_length=200, unique=True)
     overview = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
+    module_count = models.IntegerField(default=0, editable=False)
+    content_count = models.IntegerField(default=0, editable=False)
+    student_count = models.IntegerField(default=0, editable=False)
+    # Moved by every change of the course, its modules, contents and items,
+    # see courses/conditional.py
+    content_version = models.IntegerField(default=0, editable=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    counter_fields = ('module_count', 'content_count', 'student_count',
+                      'content_version')
 
     class Meta:
         ordering = ['-created']
@@ -40,22 +96,43 @@ class Course(models.Model):
         return self.title
 
 
-class Module(models.Model):
+class ModuleQuerySet(models.QuerySet):
+    def with_contents(self):
+        # Prefetch every module's contents together with their items
+        return self.prefetch_related(
+            models.Prefetch('contents', queryset=Content.objects.with_items()))
+
+
+class Module(CascadeMixin, OrderedMixin, models.Model):
     course = models.ForeignKey(Course, 
                                 related_name='modules', 
                                 on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    order = OrderField(blank=True, for_fields=['course'], default=0)
+    order = OrderField(blank=True, for_fields=['course'], gap=ORDER_GAP)
+
+    objects = ModuleQuerySet.as_manager()
+
     class Meta:
         ordering = ['order']
 
+    # The order keys are sparse, they mean nothing to the users
     def __str__(self):
-        return f'{self.order}. {self.title}'
+        return self.title
 
 
 
-class Content(models.Model):
+'''
+Resolving content.item one row at a time costs a query per content plus a
+ContentType lookup. with_items() groups the rows by content_type and loads the
+Text, Video, Image and File objects with a single query per model.
+'''
+class ContentQuerySet(models.QuerySet):
+    def with_items(self):
+        return self.prefetch_related('item')
+
+
+class Content(OrderedMixin, models.Model):
     module = models.ForeignKey(Module,
                                 related_name='contents',
                                 on_delete=models.CASCADE)
@@ -69,7 +146,9 @@ class Content(models.Model):
                                         )
     object_id = models.PositiveIntegerField()
     item = GenericForeignKey('content_type', 'object_id')
-    order = OrderField(blank=True, for_fields=['module'], default=0)
+    order = OrderField(blank=True, for_fields=['module'], gap=ORDER_GAP)
+
+    objects = ContentQuerySet.as_manager()
 
     class Meta:
         ordering = ['order']
@@ -83,6 +162,10 @@ class ItemBase(models.Model):
     title = models.CharField(max_length=250)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
+    # Pre-rendered HTML and the version of the template it came from
+    rendered = models.TextField(blank=True, editable=False)
+    rendered_version = models.CharField(max_length=40, blank=True,
+                                        editable=False)
 
     class Meta:
         abstract = True
@@ -90,17 +173,97 @@ class ItemBase(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Render once here, so the serving path only reads a string
+        self.update_rendered()
+
+    @classmethod
+    def template_name(cls):
+        return f'courses/content/{cls._meta.model_name}.html'
+
+    @classmethod
+    def render_version(cls):
+        return template_version(cls.template_name())
+
+    def render_template(self):
+        return render_to_string(self.template_name(), {'item': self})
+
+    def update_rendered(self):
+        self.rendered = self.render_template()
+        self.rendered_version = self.render_version()
+        type(self).objects.filter(pk=self.pk).update(
+                                rendered=self.rendered,
+                                rendered_version=self.rendered_version)
+
     def render(self):
-        return render_to_string(f'courses/content/{self._meta.model_name}.html',
-                                    {'item': self})
+        # Rendered with an older template, or never rendered at all
+        if self.rendered_version != self.render_version():
+            self.update_rendered()
+        return mark_safe(self.rendered)
+
 class Text(ItemBase):
     content = models.TextField()
 
+# The blobs are shared, the indexes find the other rows of a blob, see
+# ContentAddressedStorage.is_referenced()
 class File(ItemBase):
-    file = models.FileField(upload_to='files')
+    file = models.FileField(upload_to='files', storage=content_storage,
+                            db_index=True)
 
 class Image(ItemBase):
-    file = models.FileField(upload_to='images')
+    file = models.FileField(upload_to='images', storage=content_storage,
+                            db_index=True)
+    # Resized copies, see courses/images.py
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+    def srcset(self):
+        url = reverse('content_media', args=['image', self.id])
+        widths = sorted(int(width) for width in
+                        self.derivatives.get('widths', {}))
+        return ', '.join(f'{url}?w={width} {width}w' for width in widths)
 
 class Video(ItemBase):
     url = models.URLField()
+
+
+# A File or Image being uploaded in chunks, see courses/uploads.py
+class Upload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User,
+                                related_name='uploads',
+                                on_delete=models.CASCADE)
+    module = models.ForeignKey(Module,
+                                related_name='uploads',
+                                on_delete=models.CASCADE)
+    model_name = models.CharField(max_length=10,
+                                    choices=[('file', 'File'),
+                                             ('image', 'Image')])
+    title = models.CharField(max_length=250)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # Bytes received and written so far
+    offset = models.PositiveBigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.filename
+
+
+'''
+A key for the API, see courses/tokens.py. Only the SHA-256 of the key is
+stored, the client gets the key itself once, when the token is issued.
+'''
+class ApiToken(models.Model):
+    user = models.ForeignKey(User,
+                             related_name='api_tokens',
+                             on_delete=models.CASCADE)
+    digest = models.CharField(max_length=64, unique=True, editable=False)
+    # The first characters of the key, to tell the tokens apart
+    prefix = models.CharField(max_length=8, editable=False)
+    name = models.CharField(max_length=100, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.prefix}... ({self.user})'
@@ -0,0 +1,47 @@
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+
+'''
+Reorder service behind the drag and drop of modules and contents.
+
+The client posts the new position of every item, {id: position}. All the
+items are fetched, and their ownership checked, with one query. Only the
+items whose key really has to change get a new one (see
+OrderField.reorder), and all of them are written with a single
+bulk_update(), which Django turns into one UPDATE ... CASE statement.
+'''
+
+BATCH_SIZE = 500
+
+
+def reorder(queryset, positions, field_name='order'):
+    try:
+        positions = {int(id): int(position)
+                     for id, position in positions.items()}
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError('Expected an object mapping IDs to positions.')
+
+    model = queryset.model
+    field = model._meta.get_field(field_name)
+    group_fields = [model._meta.get_field(name).attname
+                    for name in field.for_fields or []]
+
+    with transaction.atomic():
+        objs = list(queryset.filter(id__in=positions)
+                            .select_for_update(of=('self',))
+                            .only('id', field.attname, *group_fields))
+        if len(objs) != len(positions):
+            # Some of the IDs do not exist or belong to somebody else
+            raise PermissionDenied
+
+        groups = {}
+        for obj in sorted(objs, key=lambda obj: positions[obj.id]):
+            group = tuple(getattr(obj, name) for name in group_fields)
+            groups.setdefault(group, []).append(obj)
+
+        changed = []
+        for group in groups.values():
+            changed.extend(field.reorder(group))
+        model.objects.bulk_update(changed, [field.attname],
+                                  batch_size=BATCH_SIZE)
+    return len(changed)
@@ -0,0 +1,25 @@
+import hashlib
+
+from django.conf import settings
+from django.template.loader import get_template
+
+'''
+The rendered HTML of content items is stored on the items themselves (see
+ItemBase.render). It is stamped with a hash of the template source, so
+editing a template makes every stored copy stale. CONTENT_RENDER_VERSION
+can be bumped to invalidate them for changes the hash cannot see, like a
+template tag library update. Run "manage.py rerender_content" after a
+deploy to re-render the stale items up front instead of on first read.
+'''
+
+_versions = {}
+
+
+def template_version(template_name):
+    version = _versions.get(template_name)
+    if version is None:
+        source = get_template(template_name).template.source
+        extra = str(getattr(settings, 'CONTENT_RENDER_VERSION', ''))
+        version = hashlib.sha1((extra + source).encode()).hexdigest()
+        _versions[template_name] = version
+    return version
@@ -0,0 +1,234 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import (catalog, conditional, counters, deletion, enrollment,
+               tokens)
+from .models import (ApiToken, Content, Course, File, Image, Module,
+                     Subject, Text, Video)
+
+
+@receiver(pre_delete, sender=Subject)
+@receiver(pre_delete, sender=Course)
+@receiver(pre_delete, sender=Module)
+def deleting(sender, instance, **kwargs):
+    # The rows below skip their handlers, see courses/deletion.py
+    deletion.mark(instance)
+
+
+@receiver([post_save, post_delete], sender=Subject)
+def subject_changed(sender, instance, **kwargs):
+    catalog.bump_subject(instance.id)
+
+
+@receiver(post_save, sender=Subject)
+def subject_saved(sender, instance, created, **kwargs):
+    # The course pages show the subject
+    if not created:
+        conditional.touch(Course.objects.filter(subject_id=instance.id))
+
+
+@receiver(pre_save, sender=Course)
+def course_moving(sender, instance, **kwargs):
+    # Remember the old subject, a course moved to another subject
+    # has to disappear from the old subject's listing
+    instance._old_subject_id = None
+    if instance.pk:
+        instance._old_subject_id = Course.objects.filter(pk=instance.pk) \
+                                        .values_list('subject_id', flat=True) \
+                                        .first()
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, **kwargs):
+    subject_ids = {instance.subject_id}
+    old_subject_id = getattr(instance, '_old_subject_id', None)
+    if old_subject_id is not None:
+        subject_ids.add(old_subject_id)
+    catalog.bump_course(*subject_ids)
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, **kwargs):
+    old_subject_id = getattr(instance, '_old_subject_id', None)
+    if created:
+        counters.add(Subject, instance.subject_id, 'course_count', 1)
+        return
+    conditional.touch_course(instance.id)
+    if old_subject_id is not None and old_subject_id != instance.subject_id:
+        counters.add(Subject, old_subject_id, 'course_count', -1)
+        counters.add(Subject, instance.subject_id, 'course_count', 1)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    if deletion.is_deleted(Subject, instance.subject_id):
+        return
+    counters.add(Subject, instance.subject_id, 'course_count', -1)
+
+
+@receiver(post_save, sender=Module)
+def module_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.add(Course, instance.course_id, 'module_count', 1)
+    conditional.touch_course(instance.course_id)
+
+
+@receiver(post_delete, sender=Module)
+def module_deleted(sender, instance, **kwargs):
+    if deletion.is_deleted(Course, instance.course_id):
+        return
+    counters.add(Course, instance.course_id, 'module_count', -1)
+    # Its contents left it to the module
+    counters.recount_contents(instance.course_id)
+    conditional.touch_course(instance.course_id)
+
+
+@receiver(post_save, sender=Content)
+def content_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.add_to_course_of_module(instance.module_id,
+                                         'content_count', 1)
+    conditional.touch_course_of_module(instance.module_id)
+
+
+@receiver(post_delete, sender=Content)
+def content_deleted(sender, instance, **kwargs):
+    # The module counts its contents again once they are all gone
+    if deletion.is_deleted(Module, instance.module_id):
+        return
+    counters.add_to_course_of_module(instance.module_id, 'content_count', -1)
+    conditional.touch_course_of_module(instance.module_id)
+
+
+@receiver(post_save, sender=Text)
+@receiver(post_save, sender=Video)
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Image)
+def item_saved(sender, instance, created, **kwargs):
+    # A new item is not in any course yet, its Content comes next
+    if not created:
+        conditional.touch_courses_of_item(instance)
+
+
+@receiver([post_save, post_delete], sender=Module)
+def module_changed(sender, instance, **kwargs):
+    if deletion.is_deleted(Course, instance.course_id):
+        # course_changed() bumps the catalog
+        return
+    if Module.course.is_cached(instance):
+        subject_id = instance.course.subject_id
+    else:
+        # The course may already be gone when its modules are deleted
+        # with a queryset
+        subject_id = Course.objects.filter(pk=instance.course_id) \
+                                .values_list('subject_id', flat=True) \
+                                .first()
+    if subject_id is None:
+        catalog.bump('courses')
+    else:
+        catalog.bump_module(subject_id)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def enrollment_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # The rows are gone by the time post_clear is sent
+        if reverse:
+            instance._cleared_course_ids = list(
+                instance.courses_joined.values_list('id', flat=True))
+        else:
+            instance._cleared_student_ids = list(
+                instance.students.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            enrollment.invalidate(instance.id)
+        elif action == 'post_clear':
+            enrollment.invalidate(*instance._cleared_student_ids)
+        else:
+            enrollment.invalidate(*pk_set)
+
+    if action == 'post_add':
+        # pk_set only holds the rows that were actually added
+        if reverse:
+            counters.add_each(Course, pk_set, 'student_count', 1)
+        else:
+            counters.add(Course, instance.id, 'student_count', len(pk_set))
+    elif action in ('post_remove', 'post_clear'):
+        # pk_set also holds rows that did not exist, count again
+        if not reverse:
+            counters.recount_students(instance.id)
+        elif action == 'post_remove':
+            counters.recount_students(*pk_set)
+        else:
+            counters.recount_students(*instance._cleared_course_ids)
+
+
+@receiver(pre_delete, sender=User)
+def student_leaving(sender, instance, **kwargs):
+    # The join table rows are deleted without any signal
+    instance._cleared_course_ids = list(
+        instance.courses_joined.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def student_left(sender, instance, **kwargs):
+    counters.recount_students(*instance._cleared_course_ids)
+
+
+@receiver(pre_save, sender=File)
+@receiver(pre_save, sender=Image)
+def item_file_replacing(sender, instance, **kwargs):
+    instance._old_file_name = None
+    if instance.pk:
+        instance._old_file_name = sender.objects.filter(pk=instance.pk) \
+                                        .values_list('file', flat=True) \
+                                        .first()
+
+
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Image)
+def item_file_replaced(sender, instance, **kwargs):
+    old_name = getattr(instance, '_old_file_name', None)
+    if old_name and old_name != instance.file.name:
+        instance.file.storage.release(old_name,
+                                      also=_derivative_names(instance, old_name))
+
+
+@receiver(post_delete, sender=File)
+@receiver(post_delete, sender=Image)
+def item_file_deleted(sender, instance, **kwargs):
+    instance.file.storage.release(
+                instance.file.name,
+                also=_derivative_names(instance, instance.file.name))
+
+
+def _derivative_names(instance, name):
+    # The resized copies of an image go with the last reference to it
+    derivatives = getattr(instance, 'derivatives', {})
+    if derivatives.get('source') != name:
+        return []
+    return list(derivatives.get('widths', {}).values())
+
+
+@receiver(post_delete, sender=ApiToken)
+def token_revoked(sender, instance, **kwargs):
+    tokens.forget(instance.digest)
+
+
+@receiver(post_save, sender=User)
+def token_user_changed(sender, instance, update_fields=None, **kwargs):
+    # The cached user may be stale (deactivated, no longer staff).
+    # Logging in only sets last_login.
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        tokens.forget_user(instance.id)
+
+
+@receiver(post_save, sender=User)
+def instructor_changed(sender, instance, created, update_fields=None,
+                       **kwargs):
+    # The course pages show the name of the instructor
+    if not created and (update_fields is None
+                        or set(update_fields) != {'last_login'}):
+        conditional.touch(Course.objects.filter(owner_id=instance.id))
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+import time
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.utils.deconstruct import deconstructible
+
+'''
+Storage for the files of File and Image content that keeps a single copy of
+every distinct file.
+
+A file is stored under the SHA-256 of its bytes, in the directory given by
+upload_to: files/ab/ab12...ef.pdf. Saving a file that is already there
+writes nothing and returns the existing name, so rows of different courses
+share the blob.
+
+Blobs are not deleted by delete() callers directly but released: release()
+deletes a blob after the commit, once no row of a model with a FileField on
+this storage refers to it anymore. The check is an index lookup per
+FileField, the file columns are indexed. A blob that was saved again in the last
+CONTENT_STORAGE_GRACE seconds is kept, the row of that save may not be
+committed yet.
+'''
+
+GRACE = getattr(settings, 'CONTENT_STORAGE_GRACE', 60)
+READ_SIZE = 1024 * 1024
+
+# <upload_to>/ab/ab12...ef.pdf
+BLOB_NAME = re.compile(r'(?P<directory>[\w-]+)/(?P<prefix>[0-9a-f]{2})/'
+                       r'(?P=prefix)[0-9a-f]{62}(\.\w+)?')
+
+
+def content_digest(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'temporary_file_path'):
+        with open(content.temporary_file_path(), 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_SIZE), b''):
+                digest.update(chunk)
+    else:
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        digest = content_digest(content)
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(self.generate_filename(name), content)
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # The same name means the same bytes, nothing to avoid
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            # Mark it as in use again for release()
+            os.utime(self.path(name))
+            return name
+        # Written next to the blob and renamed, so concurrent saves of the
+        # same file never see half of it
+        tmp = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(tmp), self.path(name))
+        return name
+
+    def file_fields(self):
+        for model in apps.get_models():
+            for field in model._meta.get_fields():
+                if isinstance(field, models.FileField) \
+                        and field.storage is self:
+                    yield model, field
+
+    def is_blob(self, name):
+        '''
+        Whether name is a blob stored for a FileField, not any other file
+        under the storage location such as the parts of chunked uploads.
+        '''
+        match = BLOB_NAME.fullmatch(name) if isinstance(name, str) else None
+        return match is not None \
+            and match['directory'] in {field.upload_to for _, field
+                                       in self.file_fields()} \
+            and self.exists(name)
+
+    def is_referenced(self, name):
+        return any(model._default_manager.filter(**{field.name: name})
+                                         .exists()
+                   for model, field in self.file_fields())
+
+    def _release(self, name, also):
+        try:
+            touched = os.stat(self.path(name)).st_mtime
+        except FileNotFoundError:
+            return
+        if touched > time.time() - GRACE or self.is_referenced(name):
+            return
+        for other in (name, *also):
+            self.delete(other)
+
+    def release(self, name, also=()):
+        '''
+        Deletes the blob and the files in also once nothing refers to the
+        blob anymore.
+        '''
+        if name:
+            transaction.on_commit(lambda: self._release(name, also))
+
+
+content_storage = ContentAddressedStorage()
@@ -1,3 +1,742 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from PIL import Image as PILImage
+
+from education.querybudget import QueryBudgetMixin, repeated_queries
+
+from . import (bench, checks, counters, enrollment, images, media, tokens,
+               uploads)
+from .api.views import CourseViewSet
+from .cloning import clone_course
+from .export import export_course
+from .models import (ORDER_GAP, ApiToken, Content, Course, File, Image,
+                     Module, Subject, Upload)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class RepeatedQueriesTests(SimpleTestCase):
+    def test_groups_statements_by_shape(self):
+        queries = [{'sql': 'SELECT * FROM "courses_text" WHERE "id" = 1'},
+                   {'sql': 'SELECT * FROM "courses_text" WHERE "id" = 2'},
+                   {'sql': "SELECT * FROM \"auth_user\" WHERE \"username\" = 'a'"},
+                   {'sql': 'SELECT * FROM "courses_module" '
+                           'WHERE "id" IN (1, 2, 3)'},
+                   {'sql': 'SELECT * FROM "courses_module" WHERE "id" IN (4)'}]
+        self.assertEqual(repeated_queries(queries), [
+            (2, 'SELECT * FROM "courses_text" WHERE "id" = %s'),
+            (2, 'SELECT * FROM "courses_module" WHERE "id" IN (...)'),
+        ])
+
+
+class BenchCompareTests(SimpleTestCase):
+    def test_serial_rps(self):
+        before = {'endpoints': {'course_list': {'rps': 100.0, 'p50_ms': 10},
+                                'gone': {'rps': 1.0, 'p50_ms': 1}}}
+        after = {'endpoints': {'course_list': {'serial_rps': 150.0,
+                                               'p50_ms': 6}}}
+        self.assertEqual(bench.compare(before, after),
+                         {'course_list': {'serial_rps_before': 100.0,
+                                          'serial_rps_after': 150.0,
+                                          'p50_ms_before': 10,
+                                          'p50_ms_after': 6,
+                                          'speedup': 1.5}})
+
+
+# A small dataset: several modules and contents per course, of every type
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BenchDataTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bench.build_dataset(subjects=2, courses=4, modules=3, contents=8,
+                            students=5, enrollments=2)
+        cls.owner = User.objects.get(username='bench-owner')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+
+'''
+Requests the pages of every view with a query budget, with a cold cache.
+With several objects of each kind, a query per object goes over the budget.
+'''
+class QueryBudgetTests(QueryBudgetMixin, BenchDataTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.owner.user_permissions.add(
+                    Permission.objects.get(codename='view_course'))
+
+    def test_hot_pages(self):
+        for name, (urls, client, headers) in bench.endpoints(sample=2).items():
+            for url in urls:
+                with self.subTest(name, url=url):
+                    self.assertQueryBudget(url, client, **headers)
+
+    def test_course_pages(self):
+        course = Course.objects.filter(students__isnull=False) \
+                               .order_by('id').first()
+        module = course.modules.last()
+        student = course.students.order_by('id').first()
+        client = Client()
+        client.force_login(student)
+        self.assertQueryBudget(reverse('student_course_detail_module',
+                                       args=[course.id, module.id]), client)
+        self.assertQueryBudget(reverse('student_course_list'), client)
+        self.assertQueryBudget(reverse('api:course-detail', args=[course.id]),
+                               client)
+        self.assertQueryBudget(reverse('api:course-list') + '?expand=modules',
+                               client)
+        self.assertQueryBudget(reverse('api:subject_list'), client)
+
+    def test_manage_pages(self):
+        client = Client()
+        client.force_login(self.owner)
+        self.assertQueryBudget(reverse('manage_course_list'), client)
+        module = Module.objects.order_by('id').first()
+        self.assertQueryBudget(reverse('module_content_list',
+                                       args=[module.id]), client)
+
+
+class OrderFieldTests(BenchDataTestCase):
+    def test_keys_follow_the_last_one(self):
+        module = Module.objects.order_by('id').first()
+        last = module.contents.order_by('order').last().order
+        item = module.contents.first().item
+        content = Content.objects.create(module=module, item=item)
+        self.assertEqual(content.order, last + ORDER_GAP)
+
+    def test_parent_row_is_locked(self):
+        course = Course.objects.order_by('id').first()
+        with CaptureQueriesContext(connection) as queries:
+            module = Module.objects.create(course=course, title='Last')
+        self.assertEqual(module.order,
+                         course.modules.count() * ORDER_GAP)
+        locks = [query['sql'] for query in queries
+                 if query['sql'].endswith('FOR NO KEY UPDATE')]
+        self.assertEqual(len(locks), 1)
+        self.assertIn('"courses_course"', locks[0])
+
+
+class CourseDetailTests(BenchDataTestCase):
+    def test_new_csrf_token_is_a_new_page(self):
+        course = Course.objects.order_by('id').first()
+        url = reverse('course_detail', args=[course.slug])
+        self.client.force_login(self.owner)
+        # The first page sets the CSRF cookie
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                                    .status_code, 304)
+
+        # Signing in again rotates the token of the enroll form
+        self.client.cookies['csrftoken'] = 'a' * 64
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CourseCloneTests(QueryBudgetMixin, BenchDataTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.owner.user_permissions.add(
+                    Permission.objects.get(codename='add_course'))
+
+    def contents(self, course):
+        return list(Content.objects.filter(module__course=course)
+                                   .select_related('module')
+                                   .prefetch_related('item')
+                                   .order_by('module__order', 'order'))
+
+    def test_copies_the_course(self):
+        course = Course.objects.order_by('id').first()
+        clone = clone_course(course)
+        self.assertEqual(clone.slug, f'{course.slug}-copy')
+        self.assertEqual(clone_course(course).slug, f'{course.slug}-copy-2')
+        self.assertEqual(counters.recount(dry_run=True),
+                         {Subject: 0, Course: 0})
+
+        pairs = list(zip(self.contents(course), self.contents(clone)))
+        self.assertEqual(len(pairs), course.content_count)
+        for original, copy in pairs:
+            self.assertEqual((copy.module.title, copy.order, copy.item.title),
+                             (original.module.title, original.order,
+                              original.item.title))
+            self.assertNotEqual(copy.item.id, original.item.id)
+            if isinstance(copy.item, (File, Image)):
+                # The blob is shared, the HTML links to the copy
+                self.assertEqual(copy.item.file.name, original.item.file.name)
+                self.assertIn(reverse('content_media', args=[
+                                        copy.item._meta.model_name,
+                                        copy.item.id]),
+                              copy.item.rendered)
+
+    def test_student_page(self):
+        course = Course.objects.filter(students__isnull=False) \
+                               .order_by('id').first()
+        student = course.students.order_by('id').first()
+        client = Client()
+        client.force_login(student)
+        url = 'student_course_detail'
+        client.get(reverse(url, args=[course.id]))
+
+        clone = clone_course(course)
+        with self.captureOnCommitCallbacks(execute=True):
+            clone.students.add(student)
+        response = client.get(reverse(url, args=[clone.id]))
+        # Its own contents, not the fragment cached for the original
+        module = clone.modules.first()
+        for content in module.contents.all():
+            self.assertContains(response, f'data-id="{content.id}"')
+        for content in course.modules.first().contents.all():
+            self.assertNotContains(response, f'data-id="{content.id}"')
+
+    def test_query_budget(self):
+        client = Client()
+        client.force_login(self.owner)
+        token, key = tokens.issue(self.owner)
+        for course in Course.objects.filter(owner=self.owner):
+            with self.subTest(course=course.slug):
+                self.assertQueryBudget(reverse('course_clone',
+                                               args=[course.id]),
+                                       client, method='post')
+                self.assertQueryBudget(reverse('api:course-clone',
+                                               args=[course.id]),
+                                       Client(), method='post',
+                                       HTTP_AUTHORIZATION=f'Token {key}')
+
+
+class CascadeDeleteTests(BenchDataTestCase):
+    def queries(self, obj):
+        with self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as queries:
+            obj.delete()
+        self.assertEqual(counters.recount(dry_run=True),
+                         {Subject: 0, Course: 0})
+        return len(queries)
+
+    def grow(self, module):
+        # Twice as many contents in the module
+        for content in list(module.contents.all()):
+            content.pk = None
+            content.order = None
+            content.save()
+
+    def test_module(self):
+        small, large = Module.objects.filter(course__owner=self.owner) \
+                                     .order_by('id')[:2]
+        self.grow(large)
+        self.assertEqual(self.queries(small), self.queries(large))
+
+    def test_course(self):
+        small, large = Course.objects.filter(owner=self.owner) \
+                                     .order_by('id')[:2]
+        for module in large.modules.all():
+            self.grow(module)
+        self.assertEqual(self.queries(small), self.queries(large))
+
+    def test_subject(self):
+        # One DELETE per 100 rows, the subjects hold fewer contents
+        first, second = Subject.objects.order_by('id')
+        self.assertNotEqual(first.course_count, second.course_count)
+        self.assertEqual(self.queries(first), self.queries(second))
+
+
+class CourseImportTests(BenchDataTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.owner.user_permissions.add(
+                    Permission.objects.get(codename='add_course'))
+        cls.token, cls.key = tokens.issue(cls.owner)
+
+    def post(self, body):
+        return self.client.post(reverse('api:course_import'), body,
+                                content_type='application/json',
+                                HTTP_AUTHORIZATION=f'Token {self.key}')
+
+    def exported(self, course, slug):
+        data = json.loads(''.join(export_course(course)))
+        data['slug'] = slug
+        return data
+
+    def test_exported_course_imports_back(self):
+        course = Course.objects.order_by('id').first()
+        response = self.post(json.dumps(self.exported(course, 'again')))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('error', response.json()['results'][0])
+
+        copy = Course.objects.get(slug='again')
+        self.assertEqual((copy.module_count, copy.content_count),
+                         (course.module_count, course.content_count))
+        for content in Content.objects.filter(module__course=copy) \
+                                      .prefetch_related('item'):
+            item = content.item
+            self.assertEqual(item.rendered_version, item.render_version())
+            if isinstance(item, (File, Image)):
+                self.assertIn(reverse('content_media', args=[
+                                        item._meta.model_name, item.id]),
+                              item.rendered)
+
+    def test_malformed_courses_are_reported(self):
+        course = Course.objects.order_by('id').first()
+        no_module_title = self.exported(course, 'no-module-title')
+        del no_module_title['modules'][0]['title']
+        long_title = self.exported(course, 'long-title')
+        long_title['title'] = 'x' * 201
+        lines = [json.dumps(data) for data in
+                 (no_module_title, [1, 2], long_title,
+                  self.exported(course, 'fine'))]
+
+        response = self.post('\n'.join(lines))
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['slug'] for result in results],
+                         ['no-module-title', None, 'long-title', 'fine'])
+        self.assertEqual(['error' in result for result in results],
+                         [True, True, True, False])
+        self.assertEqual(list(Course.objects.filter(slug__in=[
+                            'no-module-title', 'long-title', 'fine'])
+                                            .values_list('slug', flat=True)),
+                         ['fine'])
+
+
+    def test_only_stored_blobs(self):
+        course = Course.objects.order_by('id').first()
+        # Files that exist, but are no blobs of content
+        part = os.path.join(settings.MEDIA_ROOT, 'uploads', 'a.part')
+        os.makedirs(os.path.dirname(part), exist_ok=True)
+        with open(part, 'wb') as f:
+            f.write(b'secret')
+        blob = File.objects.order_by('id').first().file.name
+        names = ['uploads/a.part', '../../etc/passwd', blob + '.part',
+                 blob.replace('files/', 'uploads/'),
+                 'files/00/' + '0' * 64 + '.txt']
+        lines = []
+        for i, name in enumerate(names):
+            data = self.exported(course, f'file-{i}')
+            module = data['modules'][0]
+            module['contents'] = [{'type': 'file', 'title': 'Stolen',
+                                   'file': name}]
+            lines.append(json.dumps(data))
+
+        response = self.post('\n'.join(lines))
+        self.assertEqual([result['error'] for result in
+                          response.json()['results']],
+                         [f'Unknown file "{name}".' for name in names])
+        self.assertFalse(Course.objects.filter(slug__startswith='file-')
+                                       .exists())
+
+
+class EnrollmentIndexTests(BenchDataTestCase):
+    def test_follows_enrollment(self):
+        student = User.objects.filter(username__startswith='bench-student') \
+                              .order_by('id').first()
+        course = Course.objects.exclude(students=student).order_by('id') \
+                               .first()
+        self.assertFalse(enrollment.is_enrolled(student.id, course.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            course.students.add(student)
+        self.assertTrue(enrollment.is_enrolled(student.id, course.id))
+
+    def test_entries_expire(self):
+        with mock.patch.object(cache, 'set') as cache_set:
+            enrollment.enrolled_course_ids(self.owner.id)
+            enrollment._bump([self.owner.id])
+        self.assertEqual(cache_set.call_count, 2)
+        for call in cache_set.call_args_list:
+            self.assertEqual(call.args[2], enrollment.ENROLLMENT_TIMEOUT)
+
+    def test_shared_cache_check(self):
+        self.assertEqual([warning.id for warning in
+                          checks.shared_cache_check(None)], ['courses.W001'])
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.memcached.'
+                           'PyMemcacheCache'}}):
+            self.assertEqual(checks.shared_cache_check(None), [])
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(media.parse_range('bytes=2-5', 16), (2, 5))
+        self.assertEqual(media.parse_range('bytes=10-', 16), (10, 15))
+        self.assertEqual(media.parse_range('bytes=-3', 16), (13, 15))
+        self.assertEqual(media.parse_range('bytes=4-99', 16), (4, 15))
+        # Whole file for anything else, including multiple ranges
+        for header in (None, '', 'bytes=-', 'items=1-2', 'bytes=1-2,4-5'):
+            self.assertIsNone(media.parse_range(header, 16))
+        for header in ('bytes=16-', 'bytes=5-4', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                media.parse_range(header, 16)
+
+
+class ContentMediaTests(BenchDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = Course.objects.filter(students__isnull=False) \
+                                    .order_by('id').first()
+        self.student = self.course.students.order_by('id').first()
+        self.item = File(owner=self.owner, title='Digits')
+        self.item.file.save('digits.txt', ContentFile(b'0123456789abcdef'),
+                            save=False)
+        self.item.save()
+        Content.objects.create(module=self.course.modules.first(),
+                               item=self.item)
+        self.url = reverse('content_media', args=['file', self.item.id])
+        self.client.force_login(self.student)
+
+    def get(self, url=None, client=None, **headers):
+        response = (client or self.client).get(url or self.url, **headers)
+        response.body = b''.join(response) if response.streaming \
+                                           else response.content
+        return response
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, b'0123456789abcdef')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.body, b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/16')
+        self.assertEqual(response['Content-Length'], '4')
+        self.assertEqual(self.get(HTTP_RANGE='bytes=-3').body, b'def')
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE='bytes=16-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */16')
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_RANGE='bytes=10-', HTTP_IF_RANGE=etag)
+        self.assertEqual((response.status_code, response.body),
+                         (206, b'abcdef'))
+        # The partial copy of the client is outdated, it gets everything
+        response = self.get(HTTP_RANGE='bytes=10-', HTTP_IF_RANGE='"old"')
+        self.assertEqual((response.status_code, response.body),
+                         (200, b'0123456789abcdef'))
+
+    def test_only_owner_and_students(self):
+        stranger = User.objects.create_user('stranger')
+        self.client.force_login(stranger)
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_signed_url(self):
+        url = media.signed_media_url('file', self.item.id, self.student.id)
+        response = self.get(url, client=Client())
+        self.assertEqual(response.body, b'0123456789abcdef')
+
+        stranger = User.objects.create_user('stranger')
+        url = media.signed_media_url('file', self.item.id, stranger.id)
+        self.assertEqual(self.get(url, client=Client()).status_code, 403)
+        tampered = self.url + '?token=' + media.signed_media_url(
+                            'file', self.item.id + 1, self.student.id) \
+                                                .split('token=')[1]
+        self.assertEqual(self.get(tampered, client=Client()).status_code, 403)
+
+    def test_api_links_are_signed(self):
+        token, key = tokens.issue(self.student)
+        response = Client().get(reverse('api:course-contents',
+                                        args=[self.course.id]),
+                                HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertEqual(response.status_code, 200)
+        html = [content['item'] for module in response.json()['modules']
+                for content in module['contents']
+                if f'{self.url}?token=' in content['item']]
+        self.assertEqual(len(html), 1)
+        url = html[0].split('href="')[1].split('"')[0]
+        self.assertEqual(self.get(url, client=Client()).body,
+                         b'0123456789abcdef')
+
+    def test_signed_url_expires(self):
+        url = media.signed_media_url('file', self.item.id, self.student.id)
+        with mock.patch.object(media, 'MEDIA_URL_MAX_AGE', -1):
+            self.assertEqual(self.get(url, client=Client()).status_code, 403)
+
+
+class ContentStorageTests(BenchDataTestCase):
+    def file(self):
+        item = File(owner=self.owner, title='Notes')
+        item.file.save('notes.txt', ContentFile(b'Shared notes'), save=False)
+        item.save()
+        return item
+
+    def test_blob_goes_with_the_last_row(self):
+        first, second = self.file(), self.file()
+        name = first.file.name
+        self.assertEqual(second.file.name, name)
+        path = first.file.storage.path(name)
+
+        with mock.patch('courses.storage.GRACE', -1), \
+                self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with mock.patch('courses.storage.GRACE', -1), \
+                self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+
+
+class ImageDerivativeTests(BenchDataTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # The bench images are no images, nothing to make of them
+        for id, name in Image.objects.values_list('id', 'file'):
+            Image.objects.filter(id=id).update(
+                            derivatives={'source': name, 'widths': {}})
+
+    def image(self, mode, format):
+        buffer = io.BytesIO()
+        PILImage.new(mode, (1500, 1000)).save(buffer, format)
+        item = Image(owner=self.owner, title=mode)
+        item.file.save(f'{mode}.{format.lower()}',
+                       ContentFile(buffer.getvalue()), save=False)
+        item.save()
+        return item
+
+    def generate(self):
+        call_command('generate_image_derivatives', workers=1,
+                     stdout=mock.Mock())
+
+    def test_pending_until_generated(self):
+        photo = self.image('RGB', 'JPEG')
+        logo = self.image('RGBA', 'PNG')
+        self.assertEqual(sorted(images.pending().values_list('id', flat=True)),
+                         [photo.id, logo.id])
+        self.generate()
+        self.assertFalse(images.pending().exists())
+
+        photo.refresh_from_db()
+        self.assertEqual(sorted(photo.derivatives['widths'], key=int),
+                         ['320', '640', '1280'])
+        self.assertIn('srcset', photo.rendered)
+        logo.refresh_from_db()
+        # The copies of a transparent image keep the alpha channel
+        for name in logo.derivatives['widths'].values():
+            self.assertTrue(name.endswith('.png'))
+            with PILImage.open(logo.file.storage.path(name)) as copy:
+                self.assertEqual(copy.mode, 'RGBA')
+
+    def test_new_file_is_pending_again(self):
+        photo = self.image('RGB', 'JPEG')
+        self.generate()
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (800, 600), 'red').save(buffer, 'JPEG')
+        photo.file.save('red.jpeg', ContentFile(buffer.getvalue()))
+        self.assertEqual(list(images.pending().values_list('id', flat=True)),
+                         [photo.id])
+        self.generate()
+        photo.refresh_from_db()
+        self.assertEqual(sorted(photo.derivatives['widths'], key=int),
+                         ['320', '640'])
+
+
+class ApiTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tokens._local.clear()
+        self.user = User.objects.create_user('api', password='secret')
+        self.url = reverse('api:token')
+
+    def issue(self):
+        basic = base64.b64encode(b'api:secret').decode()
+        response = self.client.post(self.url, {'name': 'cli'},
+                                    HTTP_AUTHORIZATION=f'Basic {basic}')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['token']
+
+    def test_issue_and_revoke(self):
+        key = self.issue()
+        token = ApiToken.objects.get(user=self.user)
+        self.assertEqual(token.digest, tokens.digest(key))
+        self.assertEqual(token.prefix, key[:8])
+
+        auth = {'HTTP_AUTHORIZATION': f'Token {key}'}
+        # A token cannot create more tokens
+        self.assertEqual(self.client.post(self.url, **auth).status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(self.url, **auth).status_code,
+                             204)
+        self.assertFalse(ApiToken.objects.exists())
+        self.assertEqual(self.client.delete(self.url, **auth).status_code,
+                         401)
+
+    def test_wrong_key(self):
+        self.issue()
+        response = self.client.delete(self.url,
+                                      HTTP_AUTHORIZATION='Token nope')
+        self.assertEqual(response.status_code, 401)
+
+    def test_cached_user(self):
+        token, key = tokens.issue(self.user)
+        self.assertEqual(tokens.get_user(token.digest), self.user)
+        self.assertEqual(cache.get(f'api-token:{token.digest}'), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(tokens.get_user(token.digest), self.user)
+
+    def test_forgotten_after_user_change(self):
+        token, key = tokens.issue(self.user)
+        tokens.get_user(token.digest)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(cache.get(f'api-token:{token.digest}'),
+                         tokens.FORGOTTEN)
+        self.assertIsNone(tokens.get_user(token.digest))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = True
+            self.user.save()
+        # Read from the database, the marker is not replaced meanwhile
+        with self.assertNumQueries(1):
+            self.assertEqual(tokens.get_user(token.digest), self.user)
+        self.assertEqual(cache.get(f'api-token:{token.digest}'),
+                         tokens.FORGOTTEN)
+
+    def test_login_keeps_the_cache(self):
+        token, key = tokens.issue(self.user)
+        tokens.get_user(token.digest)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(username='api', password='secret')
+        self.assertEqual(cache.get(f'api-token:{token.digest}'), self.user)
+
+
+class ChunkedUploadTests(BenchDataTestCase):
+    data = b'0123456789' * 10
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(uploads, 'UPLOAD_DIR',
+                                    os.path.join(MEDIA_ROOT, 'uploads'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        token, key = tokens.issue(self.owner)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {key}'}
+        self.module = Module.objects.filter(course__owner=self.owner) \
+                                    .order_by('id').first()
+        response = self.client.post(reverse('api:upload_create'),
+                                    {'module': self.module.id,
+                                     'model_name': 'file', 'title': 'Digits',
+                                     'filename': 'digits.txt',
+                                     'size': len(self.data)}, **self.auth)
+        self.assertEqual(response.status_code, 201)
+        self.upload_id = response.json()['id']
+        self.url = reverse('api:upload_detail', args=[self.upload_id])
+
+    def put(self, offset, chunk):
+        return self.client.put(self.url, chunk,
+                               content_type='application/octet-stream',
+                               HTTP_UPLOAD_OFFSET=str(offset), **self.auth)
+
+    def finish(self, sha256=None):
+        return self.client.post(reverse('api:upload_finish',
+                                        args=[self.upload_id]),
+                                {'sha256': sha256} if sha256 else {},
+                                **self.auth)
+
+    def test_upload_in_chunks(self):
+        self.assertEqual(self.put(0, self.data[:40]).json()['offset'], 40)
+        self.assertEqual(self.put(40, self.data[40:]).json()['offset'], 100)
+        response = self.finish(hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(response.status_code, 201)
+
+        item = File.objects.get(id=response.json()['item'])
+        with item.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertTrue(Content.objects.filter(module=self.module,
+                                               object_id=item.id).exists())
+        self.assertFalse(Upload.objects.exists())
+
+    def test_resume_after_offset_mismatch(self):
+        self.put(0, self.data[:40])
+        # A chunk sent again, or one that skips ahead
+        for offset in (0, 60):
+            response = self.put(offset, self.data[offset:offset + 20])
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response['Upload-Offset'], '40')
+        response = self.client.get(self.url, **self.auth)
+        self.assertEqual(response['Upload-Offset'], '40')
+        self.put(40, self.data[40:])
+        self.assertEqual(self.finish(hashlib.sha256(self.data).hexdigest())
+                             .status_code, 201)
+
+    def test_unfinished_upload(self):
+        self.put(0, self.data[:40])
+        response = self.finish()
+        self.assertEqual((response.status_code, response.json()['offset']),
+                         (409, 40))
+
+    def test_sha256_mismatch(self):
+        self.put(0, self.data)
+        response = self.finish(hashlib.sha256(b'other').hexdigest())
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Upload.objects.exists())
+
+    def test_chunks_in_another_worker(self):
+        # The running hash of each chunk is lost, as when every chunk goes
+        # to another process; it is rebuilt from the bytes on disk
+        for offset in range(0, len(self.data), 30):
+            uploads._hashes.clear()
+            self.put(offset, self.data[offset:offset + 30])
+        uploads._hashes.clear()
+        response = self.finish(hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['sha256'],
+                         hashlib.sha256(self.data).hexdigest())
+
+
+class CourseValuesSerializerTests(BenchDataTestCase):
+    def assertSameAsSerializer(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with mock.patch.object(CourseViewSet, 'values_actions', ()):
+            expected = self.client.get(url)
+        self.assertEqual(response.content, expected.content)
+
+    def test_list(self):
+        url = reverse('api:course-list')
+        for query in ['', '?expand=modules', '?fields=id,title,created',
+                      '?fields=title&expand=modules', '?page_size=3']:
+            with self.subTest(query=query):
+                self.assertSameAsSerializer(url + query)
+
+    def test_next_page(self):
+        response = self.client.get(reverse('api:course-list') +
+                                   '?page_size=2&expand=modules')
+        self.assertSameAsSerializer(response.json()['next'])
+
+    def test_retrieve(self):
+        course = Course.objects.order_by('id').first()
+        url = reverse('api:course-detail', args=[course.id])
+        self.assertSameAsSerializer(url)
+        self.assertSameAsSerializer(url + '?expand=modules')
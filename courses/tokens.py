@@ -0,0 +1,112 @@
+import copy
+import hashlib
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import ApiToken
+
+'''
+API tokens, so API clients do not send their password with every request.
+
+A client trades its password for a token once (POST /api/token/) and sends
+"Authorization: Token <key>" afterwards. A key is 32 random bytes. It cannot
+be guessed like a password, so a plain SHA-256 is enough to store it, and
+resolving a key never runs the slow password hash.
+
+A key is looked up in two caches before the database:
+
+    this process          digest -> user, for LOCAL_TTL seconds
+    api-token:<digest>    digest -> user in the shared cache
+
+Revoking a token, or changing or deleting its user, forgets its entries once
+the transaction commits. The shared entry is replaced by a marker for
+FORGET_TIMEOUT seconds: readers go to the database meanwhile, and a reader
+that loaded the row before the change cannot put it back. Other processes
+may still use their own copy for up to LOCAL_TTL seconds.
+'''
+
+LOCAL_TTL = getattr(settings, 'API_TOKEN_LOCAL_TTL', 10)
+SHARED_TTL = getattr(settings, 'API_TOKEN_CACHE_TIMEOUT', 300)
+FORGET_TIMEOUT = 60
+LOCAL_MAX_SIZE = 10000
+FORGOTTEN = 'forgotten'
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+def digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _cache_key(token_digest):
+    return f'api-token:{token_digest}'
+
+
+def issue(user, name=''):
+    '''
+    Returns the new ApiToken and its key. Only the digest is stored,
+    the key cannot be shown again.
+    '''
+    key = secrets.token_urlsafe(32)
+    token = ApiToken.objects.create(user=user, digest=digest(key),
+                                    prefix=key[:8], name=name)
+    return token, key
+
+
+def _load(token_digest):
+    token = ApiToken.objects.select_related('user') \
+                            .filter(digest=token_digest).first()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def get_user(token_digest):
+    '''
+    Returns the active user the token belongs to, or None.
+    '''
+    now = time.monotonic()
+    entry = _local.get(token_digest)
+    if entry is not None and entry[0] > now:
+        # A copy, the views may set attributes on request.user
+        return copy.copy(entry[1])
+
+    key = _cache_key(token_digest)
+    user = cache.get(key)
+    if user is None or user == FORGOTTEN:
+        forgotten = user == FORGOTTEN
+        user = _load(token_digest)
+        if user is None:
+            return None
+        if not forgotten:
+            cache.add(key, user, SHARED_TTL)
+
+    with _local_lock:
+        if len(_local) >= LOCAL_MAX_SIZE:
+            _local.clear()
+        _local[token_digest] = (now + LOCAL_TTL, user)
+    return copy.copy(user)
+
+
+def _forget(digests):
+    cache.set_many({_cache_key(token_digest): FORGOTTEN
+                    for token_digest in digests}, FORGET_TIMEOUT)
+    with _local_lock:
+        for token_digest in digests:
+            _local.pop(token_digest, None)
+
+
+def forget(*digests):
+    if digests:
+        transaction.on_commit(lambda: _forget(digests))
+
+
+def forget_user(user_id):
+    forget(*ApiToken.objects.filter(user_id=user_id)
+                            .values_list('digest', flat=True))
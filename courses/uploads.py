@@ -0,0 +1,179 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.db import transaction
+
+from .models import Content, File, Image, Upload
+
+'''
+Chunked, resumable uploads of File and Image content.
+
+An upload is opened with the module, title, file name and total size. The
+client then sends the file in chunks, each one with the offset it starts
+at. The chunks are appended to a temp file in CHUNKED_UPLOAD_DIR, and the
+offset stored on the Upload is only moved forward once the chunk is on
+disk. After a network drop the client asks for the offset and carries on
+from there; a chunk that does not start at the stored offset is refused.
+
+The SHA-256 of the file is computed while the chunks come in. Hashes live
+in this process only, so after a restart (or when another worker receives
+the next chunk) the hash is rebuilt from the bytes already on disk.
+
+finish() moves the temp file into the media storage and creates the item
+and its Content in one transaction.
+'''
+
+UPLOAD_DIR = getattr(settings, 'CHUNKED_UPLOAD_DIR',
+                     os.path.join(settings.MEDIA_ROOT, 'uploads'))
+MAX_SIZE = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+MAX_CHUNK_SIZE = getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE',
+                         16 * 1024 ** 2)
+READ_SIZE = 64 * 1024
+HASHES_MAX_SIZE = 1000
+
+MODELS = {'file': File, 'image': Image}
+
+# upload id -> (offset, sha256 of the bytes up to offset)
+_hashes = {}
+
+
+class UploadError(ValueError):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    def __init__(self, offset):
+        super().__init__(f'Expected a chunk starting at offset {offset}.')
+        self.offset = offset
+
+
+class _TempFile(DjangoFile):
+    # FileSystemStorage moves files that have a temporary path
+    # instead of copying them
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def temp_path(upload):
+    return os.path.join(UPLOAD_DIR, f'{upload.id}.part')
+
+
+def start(owner, module, model_name, title, filename, size):
+    if model_name not in MODELS:
+        raise UploadError(f'Unknown content type {model_name}.')
+    if size > MAX_SIZE:
+        raise UploadError(f'Files are limited to {MAX_SIZE} bytes.')
+    upload = Upload.objects.create(owner=owner, module=module,
+                                   model_name=model_name, title=title,
+                                   filename=os.path.basename(filename),
+                                   size=size)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    open(temp_path(upload), 'wb').close()
+    return upload
+
+
+def _hash(upload):
+    offset, digest = _hashes.get(upload.id, (None, None))
+    if offset == upload.offset:
+        # A copy, a failed chunk must not change the cached hash
+        return digest.copy()
+    digest = hashlib.sha256()
+    remaining = upload.offset
+    with open(temp_path(upload), 'rb') as f:
+        while remaining:
+            data = f.read(min(READ_SIZE, remaining))
+            if not data:
+                raise UploadError('The temp file of the upload is missing data.')
+            digest.update(data)
+            remaining -= len(data)
+    return digest
+
+
+def append(upload_id, owner, offset, stream, length):
+    '''
+    Writes length bytes read from stream at offset and returns the Upload
+    with its new offset. The row stays locked meanwhile, so two requests
+    for the same upload cannot interleave their chunks.
+    '''
+    with transaction.atomic():
+        upload = Upload.objects.select_for_update() \
+                               .get(id=upload_id, owner=owner)
+        if offset != upload.offset:
+            raise OffsetMismatch(upload.offset)
+        if length > MAX_CHUNK_SIZE:
+            raise UploadError(f'Chunks are limited to {MAX_CHUNK_SIZE} bytes.')
+        if upload.offset + length > upload.size:
+            raise UploadError('The chunk goes past the end of the file.')
+
+        digest = _hash(upload)
+        with open(temp_path(upload), 'r+b') as f:
+            # Drop what a failed request may have written after the offset
+            f.truncate(upload.offset)
+            f.seek(upload.offset)
+            remaining = length
+            while remaining:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    raise UploadError('The chunk is shorter than announced.')
+                f.write(data)
+                digest.update(data)
+                remaining -= len(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        upload.offset += length
+        upload.save(update_fields=['offset', 'updated'])
+    # Uploads finished or given up in other workers leave their hash here
+    if len(_hashes) >= HASHES_MAX_SIZE:
+        _hashes.clear()
+    _hashes[upload.id] = (upload.offset, digest)
+    return upload
+
+
+def finish(upload_id, owner, sha256=None):
+    '''
+    Turns a complete upload into a File or Image and its Content. When the
+    client sends the SHA-256 of the file, it has to match.
+    '''
+    item = None
+    try:
+        with transaction.atomic():
+            upload = Upload.objects.select_for_update(of=('self',)) \
+                                   .select_related('module') \
+                                   .get(id=upload_id, owner=owner)
+            if upload.offset != upload.size:
+                raise OffsetMismatch(upload.offset)
+            key = upload.id
+            digest = _hash(upload).hexdigest()
+            if sha256 and sha256.lower() != digest:
+                raise UploadError('The SHA-256 of the upload does not match.')
+
+            path = temp_path(upload)
+            item = MODELS[upload.model_name](owner=owner, title=upload.title)
+            with open(path, 'rb') as f:
+                item.file.save(upload.filename, _TempFile(f), save=False)
+            item.save()
+            content = Content.objects.create(module=upload.module, item=item)
+            upload.delete()
+    except Exception:
+        # The file may already be in the storage without a row
+        if item is not None and item.file:
+            item.file.storage.release(item.file.name)
+        raise
+    _hashes.pop(key, None)
+    # Left behind when the storage already had the same file
+    if os.path.exists(path):
+        os.remove(path)
+    return content, digest
+
+
+def abort(upload):
+    path = temp_path(upload)
+    _hashes.pop(upload.id, None)
+    upload.delete()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -7,6 +7,7 @@ urlpatterns = [
     path('create/', views.CourseCreateView.as_view(), name='course_create'),
     path('<pk>/edit/', views.CourseUpdateView.as_view(), name='course_edit'),
     path('<pk>/delete/', views.CourseDeleteView.as_view(), name='course_delete'),
+    path('<pk>/clone/', views.CourseCloneView.as_view(), name='course_clone'),
     path('<pk>/module/', views.CourseModuleUpdateView.as_view(), name='course_module_update'),
 
     path('module/<int:module_id>/content/<model_name>/create/', views.ContentCreateUpdateView.as_view(), 
@@ -15,6 +16,8 @@ urlpatterns = [
                                                             name='module_content_update'),
     path('content/<int:id>/delete/',views.ContentDeleteView.as_view(),
                                                             name='module_content_delete'),
+    path('content/<model_name>/<int:id>/media/', views.ContentMediaView.as_view(),
+                                                            name='content_media'),
     path('module/<int:module_id>/', views.ModuleContentListView.as_view(),
                                                             name='module_content_list'),
     path('module/order/', views.ModuleOrderView.as_view(), name='module_order'),
@@ -2,20 +2,28 @@ from braces.views import CsrfExemptMixin, JsonRequestResponseMixin
 from django.apps import apps
 from django.contrib.auth.mixins import (LoginRequiredMixin,
                                         PermissionRequiredMixin)
-from django.core.cache import cache
-from django.db.models import Count
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import PermissionDenied
+from django.db.models import OuterRef, Subquery
 from django.forms.models import modelform_factory
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.views.generic.base import TemplateResponseMixin, View
-from django.views.generic.detail import DetailView
+from django.views.generic.detail import DetailView, SingleObjectMixin
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.views.generic.list import ListView
 
+from education.querybudget import query_budget
 from students.forms import CourseEnrollForm
 
+from . import catalog, conditional, media, ordering
+from .cloning import clone_course
+from .conditional import ConditionalMixin, make_etag
+from .enrollment import is_enrolled
 from .forms import ModuleFormSet
-from .models import Content, Course, Module, Subject
+from .models import Content, Course, Module
+from .rendering import template_version
 
 # Create your views here.
 '''
@@ -65,10 +73,18 @@ permission specified in the permission_required attribute. Your views are
 now only accessible to users with proper permissions.
 '''
 # Lists the courses created by the user
+@query_budget(5)
 class ManageCourseListView(OwnerCourseMixin, ListView):
     template_name = 'courses/manage/course/list.html'
     permission_required = 'courses.view_course'
 
+    def get_queryset(self):
+        # The link to the contents needs the first module of each course
+        return super().get_queryset().annotate(first_module_id=Subquery(
+                    Module.objects.filter(course=OuterRef('pk'))
+                                  .order_by('order')
+                                  .values('id')[:1]))
+
 # Uses a model form to create a new Course object.
 class CourseCreateView(OwnerCourseEditMixin, CreateView):
     permission_required = 'courses.add_course'
@@ -84,6 +100,17 @@ class CourseDeleteView(OwnerCourseMixin, DeleteView):
     permission_required = 'courses.delete_course'
 
 
+# Copies a course with its modules and contents, then opens the copy for
+# editing so it can be renamed. See courses/cloning.py.
+@query_budget(25)
+class CourseCloneView(OwnerCourseMixin, SingleObjectMixin, View):
+    permission_required = 'courses.add_course'
+
+    def post(self, request, *args, **kwargs):
+        clone = clone_course(self.get_object(), owner=request.user)
+        return redirect('course_edit', clone.id)
+
+
 '''
 The CourseModuleUpdateView view handles the formset to add, update, and
 delete modules for a specific course.
@@ -220,74 +247,137 @@ class ContentDeleteView(View):
         return redirect('module_content_list', module.id)                 
 
 
+'''
+Serves the file of a File or Image content to its owner and to the
+students of the courses that use it. Clients without a session can use a
+signed URL from media.signed_media_url() instead. ?w=<width> serves one of
+the resized copies of an image.
+'''
+class ContentMediaView(View):
+
+    def get(self, request, model_name, id):
+        if model_name not in ['file', 'image']:
+            raise Http404
+        model = apps.get_model(app_label='courses', model_name=model_name)
+        item = get_object_or_404(model, id=id)
+
+        user_id = request.user.id
+        if 'token' in request.GET:
+            user_id = media.check_token(request.GET['token'], model_name, id)
+            if user_id is None:
+                raise PermissionDenied
+
+        if item.owner_id != user_id:
+            course_ids = Content.objects.filter(
+                            content_type=ContentType.objects.get_for_model(model),
+                            object_id=id).values_list('module__course_id', flat=True)
+            if not any(is_enrolled(user_id, course_id) for course_id in course_ids):
+                raise PermissionDenied
+
+        name = item.file.name
+        if 'w' in request.GET and model_name == 'image':
+            # One of the resized copies
+            name = item.derivatives.get('widths', {}).get(request.GET['w'])
+            if name is None:
+                raise Http404
+        response = media.serve_file(request, item.file.storage, name)
+        if response is None:
+            raise Http404
+        return response
+
+
 # Display all modules for a course and list the contents of a specific module.
+@query_budget(10)
 class ModuleContentListView(TemplateResponseMixin, View):
     template_name = 'courses/manage/module/content_list.html'
 
     def get(self, request, module_id):
-        module = get_object_or_404(Module, 
+        module = get_object_or_404(Module.objects.with_contents(),
                                     id=module_id,
                                     course__owner=request.user)
-        return self.render_to_response({'module': module})
+        # Order keys are sparse, number the modules by their position
+        modules = list(module.course.modules.all())
+        return self.render_to_response({'module': module,
+                                        'modules': modules,
+                                        'module_number': modules.index(module) + 1})
+
+
+# Applies the new order sent by the drag and drop in content_list.html
+class OrderMixin(CsrfExemptMixin, JsonRequestResponseMixin):
+    require_json = True
+
+    # course_lookup finds the courses of the reordered objects by their ids
+    def reorder(self, queryset, course_lookup):
+        try:
+            updated = ordering.reorder(queryset, self.request_json)
+        except ValueError as e:
+            return self.render_bad_request_response({'errors': [str(e)]})
+        except PermissionDenied:
+            return self.render_json_response({'errors': ['Not allowed.']},
+                                             status=403)
+        # bulk_update() sends no signals
+        if updated:
+            conditional.touch(Course.objects.filter(
+                                    **{course_lookup: list(self.request_json)}))
+        return self.render_json_response({'saved': 'OK', 'updated': updated})
 
 
 #  A view that receives the new order of module IDs encoded in JSON.'
-class ModuleOrderView(CsrfExemptMixin, 
-                        JsonRequestResponseMixin, View):
+class ModuleOrderView(OrderMixin, View):
     def post(self, request):
-        for id, order in self.request_json.items():
-            Module.objects.filter(id=id,
-                course__owner=request.user).update(order=order)
-        return self.render_json_response({'saved': 'OK'})
+        return self.reorder(Module.objects.filter(course__owner=request.user),
+                            'modules__id__in')
 
 
-class ContentOrderView(CsrfExemptMixin, 
-                        JsonRequestResponseMixin, View):
+class ContentOrderView(OrderMixin, View):
     def post(self, request):
-        for id, order in self.request_json.items():
-            Content.objects.filter(id=id,
-                                    module__course__owner=request.user) \
-                                        .update(order=order)
-            return self.render_json_response({'saved': 'OK'})
+        return self.reorder(Content.objects.filter(
+                                    module__course__owner=request.user),
+                            'modules__contents__id__in')
 
-            
 
 # Displaying courses views
+@query_budget(2)
 class CourseListView(TemplateResponseMixin, View):
     model = Course
     template_name = 'courses/course/list.html'
 
     def get(self, request, subject=None):
-        # Caching for course list
-        subjects = cache.get('all_subjects')
-        if not subjects:
-            subjects = Subject.objects.annotate(total_courses=Count('courses'))
-            cache.set('all_subjects', subjects)
-        all_courses = Course.objects.annotate(total_modules=Count('modules'))
+        # Materialized rows from the catalog cache, see courses/catalog.py
+        subjects = catalog.get_subjects()
 
         if subject:
-            subject = get_object_or_404(Subject, slug=subject)
-            key = f'subject_{subject.id}_courses'
-            courses = cache.get(key)
-
-            if not courses:
-                courses = all_courses.filter(subject=subject)
-                cache.set(key, courses)
+            subject = next((s for s in subjects if s['slug'] == subject), None)
+            if subject is None:
+                raise Http404('No Subject matches the given query.')
+            courses = catalog.get_courses(subject['id'])
         else:
-            courses = cache.get('all_courses')
-            if not courses:
-                courses = all_courses
-                cache.set('all_courses', courses)
-        
-        return self.render_to_response({ 'subjects': subjects, 
+            courses = catalog.get_courses()
+
+        return self.render_to_response({ 'subjects': subjects,
                                     'subject': subject,
                                     'courses': courses})
-        
 
-class CourseDetailView(DetailView):
+
+@query_budget(5)
+class CourseDetailView(ConditionalMixin, DetailView):
     model = Course
     template_name = 'courses/course/detail.html'
 
+    def get_version(self):
+        row = Course.objects.filter(slug=self.kwargs['slug']) \
+                            .values('content_version', 'updated').first()
+        if row is None:
+            return None
+        # The enroll form shows for signed in users only, with a CSRF
+        # token that changes when they sign in again
+        csrf_secret = self.request.META.get('CSRF_COOKIE') \
+                        if self.request.user.is_authenticated else None
+        etag = make_etag('course', row['content_version'],
+                         self.request.user.id, csrf_secret,
+                         template_version(self.template_name))
+        return etag, row['updated']
+
     # Enroll button form
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
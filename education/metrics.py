@@ -0,0 +1,169 @@
+import threading
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+
+'''
+Per-request performance numbers, see education.middleware.
+
+While a request runs, its RequestStats collect the time and number of SQL
+queries, the time spent rendering templates, and the cache hits and misses.
+The middleware sends them back in a Server-Timing header and adds them to
+histograms per view, which metrics_view serves in the Prometheus text format
+at /metrics.
+
+The histograms live in the memory of each process. With several workers
+every scrape sees the numbers of the worker that answered it.
+'''
+
+DURATION_BUCKETS = getattr(settings, 'METRICS_DURATION_BUCKETS',
+                           (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                            1, 2.5, 5, 10))
+QUERY_BUCKETS = getattr(settings, 'METRICS_QUERY_BUCKETS',
+                        (1, 2, 5, 10, 20, 50, 100, 200))
+
+_current = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_time = 0.0
+        # Nested renders and cache calls are part of the outer one
+        self.template_depth = 0
+        self.cache_depth = 0
+
+    def sql(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += perf_counter() - start
+            self.sql_count += 1
+
+    def header(self, total):
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;dur={self.cache_time * 1000:.1f};'
+            f'desc="{self.cache_hits} hits {self.cache_misses} misses"',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def current():
+    return _current.get()
+
+
+def start_request():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    # name: (type, help, buckets)
+    METRICS = {
+        'django_request_duration_seconds':
+            ('histogram', 'Time to build the response.', DURATION_BUCKETS),
+        'django_request_sql_seconds':
+            ('histogram', 'Time spent in SQL queries.', DURATION_BUCKETS),
+        'django_request_sql_queries':
+            ('histogram', 'Number of SQL queries.', QUERY_BUCKETS),
+        'django_request_template_seconds':
+            ('histogram', 'Time spent rendering templates.', DURATION_BUCKETS),
+        'django_request_cache_hits_total':
+            ('counter', 'Cache reads that found the key.', None),
+        'django_request_cache_misses_total':
+            ('counter', 'Cache reads that did not find the key.', None),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {name: {} for name in self.METRICS}
+
+    def record(self, view, stats, total):
+        observed = {
+            'django_request_duration_seconds': total,
+            'django_request_sql_seconds': stats.sql_time,
+            'django_request_sql_queries': stats.sql_count,
+            'django_request_template_seconds': stats.template_time,
+            'django_request_cache_hits_total': stats.cache_hits,
+            'django_request_cache_misses_total': stats.cache_misses,
+        }
+        with self.lock:
+            for name, value in observed.items():
+                kind, _, buckets = self.METRICS[name]
+                if kind == 'counter':
+                    self.values[name][view] = \
+                                    self.values[name].get(view, 0) + value
+                else:
+                    if view not in self.values[name]:
+                        self.values[name][view] = Histogram(buckets)
+                    self.values[name][view].observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (kind, help_text, _) in self.METRICS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for view, value in sorted(self.values[name].items()):
+                    label = f'view="{_escape(view)}"'
+                    if kind == 'counter':
+                        lines.append(f'{name}{{{label}}} {value}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} '
+                                     f'{cumulative}')
+                    lines.append(f'{name}_bucket{{{label},le="+Inf"}} '
+                                 f'{value.count}')
+                    lines.append(f'{name}_sum{{{label}}} {value.sum}')
+                    lines.append(f'{name}_count{{{label}}} {value.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+def metrics_view(request):
+    # Staff, the addresses in INTERNAL_IPS (e.g. the Prometheus server),
+    # or anybody while DEBUG is on
+    if not (settings.DEBUG
+            or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+            or request.user.is_staff):
+        raise PermissionDenied
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
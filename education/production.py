@@ -0,0 +1,56 @@
+"""
+Production settings, used by gunicorn (see gunicorn.conf.py).
+
+Everything else comes from education.settings. The values below can be
+changed through the environment like the rest of the configuration.
+"""
+
+from decouple import Csv, config
+
+from .settings import *  # noqa: F401,F403
+from .settings import ALLOWED_HOSTS, DATABASES, MIDDLEWARE
+
+DEBUG = False
+
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default=','.join(ALLOWED_HOSTS),
+                       cast=Csv())
+
+# Keep the connection of each worker thread open between requests instead
+# of connecting for every request. DatabaseHealthMiddleware replaces the
+# connections the server dropped in the meantime.
+DATABASES = {
+    alias: {
+        **database,
+        'CONN_MAX_AGE': config('CONN_MAX_AGE', default=600, cast=int),
+        'OPTIONS': {
+            'connect_timeout': 5,
+            # Lets the kernel notice dead peers on idle connections
+            'keepalives': 1,
+            'keepalives_idle': 60,
+            'keepalives_interval': 10,
+            'keepalives_count': 3,
+            **database.get('OPTIONS', {}),
+        },
+    }
+    for alias, database in DATABASES.items()
+}
+DATABASE_HEALTH_CHECK_IDLE = config('DATABASE_HEALTH_CHECK_IDLE', default=30,
+                                    cast=int)
+
+MIDDLEWARE = [MIDDLEWARE[0],
+              'education.middleware.DatabaseHealthMiddleware',
+              *MIDDLEWARE[1:]]
+
+# Shared by all the workers, the catalog, enrollment, progress and token
+# caches only work across processes with a shared cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': config('MEMCACHED_LOCATION', default='127.0.0.1:11211',
+                           cast=Csv()),
+        'TIMEOUT': 300,
+    }
+}
+
+# Sessions are read from the cache, and written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
@@ -0,0 +1,101 @@
+import re
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+'''
+Query budgets: the most SQL queries a view may run to answer one request.
+
+Decorate the view function or class with the budget, or a viewset with one
+budget per action:
+
+    @query_budget(4)
+    class CourseDetailView(DetailView):
+        ...
+
+    @query_budget(list=3, retrieve=3, contents=6)
+    class CourseViewSet(viewsets.ReadOnlyModelViewSet):
+        ...
+
+The budget costs nothing at runtime, only the tests read it.
+QueryBudgetMixin.assertQueryBudget() requests a URL, looks up the budget of
+the view it resolves to and fails when the view ran more queries, listing
+the statements that ran more than once. That is how an N+1 loop in a
+template or a nested serializer shows up.
+'''
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+
+
+def query_budget(queries=None, **actions):
+    def decorator(view):
+        if queries is not None:
+            view.query_budget = queries
+        if actions:
+            view.query_budgets = {**getattr(view, 'query_budgets', {}),
+                                  **actions}
+        return view
+    return decorator
+
+
+def budget_for(match, method='get'):
+    view = match.func
+    cls = getattr(view, 'view_class', None) or getattr(view, 'cls', None) \
+                                                                    or view
+    # Viewsets map the HTTP method to an action
+    action = getattr(view, 'actions', {}).get(method)
+    budgets = getattr(cls, 'query_budgets', {})
+    if action in budgets:
+        return budgets[action]
+    return getattr(cls, 'query_budget', None)
+
+
+def normalize(sql):
+    # The same statement with other values, and IN lists of any length
+    return _LISTS.sub('(...)', _LITERALS.sub('%s', sql))
+
+
+def repeated_queries(queries):
+    counts = Counter(normalize(query['sql']) for query in queries)
+    return [(count, sql) for sql, count in counts.most_common() if count > 1]
+
+
+def over_budget_message(view_name, budget, queries):
+    lines = [f'{view_name} ran {len(queries)} queries, '
+             f'its budget is {budget}.']
+    repeated = repeated_queries(queries)
+    if repeated:
+        lines.append('Repeated statements:')
+        lines.extend(f'  {count}x {sql}' for count, sql in repeated)
+    else:
+        lines.append('No statement ran more than once:')
+        lines.extend(f'  {query["sql"]}' for query in queries)
+    return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    '''
+    For TestCase classes. The data of the test should have a few objects
+    of each kind, so a query per object exceeds the budget.
+    '''
+    def assertQueryBudget(self, url, client=None, method='get', **extra):
+        client = client or self.client
+        match = resolve(urlsplit(url).path)
+        budget = budget_for(match, method)
+        if budget is None:
+            self.fail(f'{match.view_name} has no query budget.')
+
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(client, method)(url, **extra)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400,
+                        f'{url} answered {response.status_code}.')
+        if len(captured) > budget:
+            self.fail(over_budget_message(match.view_name, budget,
+                                          captured.captured_queries))
+        return response
@@ -0,0 +1,58 @@
+"""
+gunicorn configuration, read from the working directory by the Procfile.
+
+The number of workers follows the CPUs this process may run on. With two
+or more, there are 2 * CPUs + 1 sync worker processes. On a single CPU,
+two gthread workers with four threads each are cheaper in memory and still
+overlap the waits on the database. WEB_CONCURRENCY, GUNICORN_WORKER_CLASS
+and GUNICORN_THREADS override the choice.
+"""
+
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'education.production')
+
+
+def _cpu_count():
+    try:
+        # The CPUs of the container, not of the host
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return multiprocessing.cpu_count()
+
+
+cpus = _cpu_count()
+if cpus > 1:
+    worker_class = 'sync'
+    workers = 2 * cpus + 1
+    threads = 1
+else:
+    worker_class = 'gthread'
+    workers = 2
+    threads = 4
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', worker_class)
+workers = int(os.environ.get('WEB_CONCURRENCY', workers))
+threads = int(os.environ.get('GUNICORN_THREADS', threads))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Import Django once in the master, the workers share the loaded code
+preload_app = True
+# Recycle the workers now and then, against slow memory growth
+max_requests = 1000
+max_requests_jitter = 100
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+
+def post_fork(server, worker):
+    # Nothing opened by the master may be shared with the workers
+    from django.core.cache import caches
+    from django.db import connections
+
+    connections.close_all()
+    for cache in caches.all():
+        cache.close()
@@ -1,16 +1,20 @@
-from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 
+from . import outbox
+
+SENDER = 'waithakawaweru96@gmail.com.com'
+WELCOME_SUBJECT = 'Welcome to Elimisha Africa'
 
-def send_welcome_email(name, receiver):
-    # Creating message subject and sender
-    subject = 'Welcome to Elimisha Africa'
-    sender = 'waithakawaweru96@gmail.com.com'
 
+def render_email(name):
     #passing in the context vairables
     text_content = render_to_string('email/email.txt',{"name": name})
     html_content = render_to_string('email/email.html',{"name": name})
+    return text_content, html_content
 
-    msg = EmailMultiAlternatives(subject, text_content, sender, [receiver])
-    msg.attach_alternative(html_content, 'text/html')
-    msg.send()
\ No newline at end of file
+
+def send_welcome_email(name, receiver):
+    # Only queued, the send_outbox command sends it
+    text_content, html_content = render_email(name)
+    return outbox.queue(receiver, SENDER, WELCOME_SUBJECT,
+                        text_content, html_content)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from landingpage import outbox
+from landingpage.email import SENDER, render_email
+
+
+class Command(BaseCommand):
+    help = ('Queue a newsletter for every newsletter recipient, '
+            'once per email address')
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign',
+                            help='Name of the newsletter, an address gets '
+                                 'each campaign only once')
+        parser.add_argument('subject')
+
+    def handle(self, *args, **options):
+        total = outbox.queue_newsletter(options['campaign'], SENDER,
+                                        options['subject'], render_email)
+        self.stdout.write(f'Queued {total} emails, '
+                          f'run send_outbox to send them')
@@ -0,0 +1,40 @@
+import time
+from smtplib import SMTPException
+
+from django.core.management.base import BaseCommand
+
+from landingpage import outbox
+
+
+class Command(BaseCommand):
+    help = 'Send the queued emails of the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=outbox.BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and look for new emails')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between two looks, with --loop')
+
+    def handle(self, *args, **options):
+        # Looks in a row the mail server could not be reached
+        down = 0
+        while True:
+            try:
+                sent, failed = outbox.drain(options['batch_size'])
+            except (OSError, SMTPException) as e:
+                if not options['loop']:
+                    raise
+                down += 1
+                delay = outbox.backoff(down).total_seconds()
+                self.stderr.write(f'Mail server unreachable ({e}), '
+                                  f'trying again in {delay:.0f} s')
+                time.sleep(delay)
+                continue
+            down = 0
+            if sent or failed or not options['loop']:
+                self.stdout.write(f'Sent {sent} emails, {failed} failed')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
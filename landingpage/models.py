@@ -1,6 +1,39 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 class NewsLetterRecipients(models.Model):
     name = models.CharField(max_length=30)
-    email = models.EmailField()
\ No newline at end of file
+    email = models.EmailField()
+
+# Email waiting to be sent by the send_outbox command, see outbox.py
+class OutgoingEmail(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'),
+                      (SENT, 'Sent'),
+                      (FAILED, 'Failed')]
+
+    to = models.EmailField()
+    sender = models.CharField(max_length=254)
+    subject = models.CharField(max_length=250)
+    text = models.TextField()
+    html = models.TextField(blank=True)
+    # Set for newsletters, an address gets each newsletter only once
+    campaign = models.CharField(max_length=100, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt'])]
+        constraints = [models.UniqueConstraint(fields=['campaign', 'to'],
+                                               name='unique_campaign_email')]
+
+    def __str__(self):
+        return f'{self.subject} to {self.to}'
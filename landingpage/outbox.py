@@ -0,0 +1,164 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .models import NewsLetterRecipients, OutgoingEmail
+
+'''
+Email outbox.
+
+Views never talk to the mail server. They add an OutgoingEmail in their own
+transaction, so the email exists exactly when the sign-up that caused it
+was committed, and the send_outbox command delivers it later.
+
+The command claims a batch of due emails, leasing them for OUTBOX_LEASE
+seconds so several workers can run side by side, and sends the whole batch
+over a single connection. A failed email is tried again after 1, 2, 4...
+minutes (at most OUTBOX_MAX_BACKOFF) until OUTBOX_MAX_ATTEMPTS is reached.
+'''
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'OUTBOX_BATCH_SIZE', 100)
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 6)
+BACKOFF = getattr(settings, 'OUTBOX_BACKOFF', 60)
+MAX_BACKOFF = getattr(settings, 'OUTBOX_MAX_BACKOFF', 3600)
+LEASE = getattr(settings, 'OUTBOX_LEASE', 300)
+
+
+def queue(to, sender, subject, text, html='', campaign=None):
+    return OutgoingEmail.objects.create(to=to, sender=sender,
+                                        subject=subject, text=text,
+                                        html=html, campaign=campaign)
+
+
+def queue_newsletter(campaign, sender, subject, render, batch_size=500):
+    '''
+    Queues one email per distinct address of NewsLetterRecipients.
+    render(name) returns the text and html bodies. Addresses that already
+    got this campaign are skipped, so an interrupted run can be repeated.
+    Returns the number of emails queued.
+    '''
+    recipients = NewsLetterRecipients.objects \
+                            .annotate(address=Lower('email')) \
+                            .order_by('address', 'id') \
+                            .values_list('address', 'name')
+    already = OutgoingEmail.objects.filter(campaign=campaign)
+    total = 0
+    batch = []
+    previous = None
+    for address, name in recipients.iterator(chunk_size=batch_size):
+        # Sorted by address, a repeated sign-up follows the first one
+        if address == previous:
+            continue
+        previous = address
+        text, html = render(name)
+        batch.append(OutgoingEmail(to=address, sender=sender,
+                                   subject=subject, text=text, html=html,
+                                   campaign=campaign))
+        if len(batch) >= batch_size:
+            total += _create(batch, already)
+    total += _create(batch, already)
+    return total
+
+
+def _create(batch, already):
+    addresses = {email.to for email in batch}
+    known = set(already.filter(to__in=addresses)
+                       .values_list('to', flat=True))
+    new = [email for email in batch if email.to not in known]
+    OutgoingEmail.objects.bulk_create(new, ignore_conflicts=True)
+    batch.clear()
+    return len(new)
+
+
+def claim(batch_size=BATCH_SIZE):
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(OutgoingEmail.objects
+                            .select_for_update(skip_locked=True)
+                            .filter(status=OutgoingEmail.PENDING,
+                                    next_attempt__lte=now)
+                            .order_by('next_attempt', 'id')[:batch_size])
+        # A worker that dies mid-batch gives its emails back
+        # when the lease runs out
+        OutgoingEmail.objects.filter(id__in=[email.id for email in emails]) \
+                             .update(next_attempt=now + timedelta(seconds=LEASE))
+    return emails
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF))
+
+
+def deliver(emails, connection):
+    sent = failed = 0
+    for email in emails:
+        message = EmailMultiAlternatives(email.subject, email.text,
+                                         email.sender, [email.to],
+                                         connection=connection)
+        if email.html:
+            message.attach_alternative(email.html, 'text/html')
+        email.attempts += 1
+        try:
+            message.send()
+        except Exception as e:
+            logger.warning('Sending email %s failed: %s', email.id, e)
+            _reconnect(connection)
+            email.last_error = str(e)
+            if email.attempts >= MAX_ATTEMPTS:
+                email.status = OutgoingEmail.FAILED
+            else:
+                email.next_attempt = timezone.now() + backoff(email.attempts)
+            failed += 1
+        else:
+            email.status = OutgoingEmail.SENT
+            email.sent = timezone.now()
+            sent += 1
+        email.save(update_fields=['attempts', 'status', 'next_attempt',
+                                  'last_error', 'sent'])
+    return sent, failed
+
+
+def _reconnect(connection):
+    # The connection may be broken after an error
+    try:
+        connection.close()
+        connection.open()
+    except Exception:
+        # The next send opens its own connection
+        pass
+
+
+def drain(batch_size=BATCH_SIZE, connection=None):
+    '''
+    Sends due emails until there are none left and returns the number sent
+    and failed. All batches share one connection to the mail server, which
+    is only opened when there is something to send. When it cannot be
+    opened, the claimed emails are given back and the error is raised.
+    '''
+    emails = claim(batch_size)
+    if not emails:
+        return 0, 0
+    connection = connection or get_connection()
+    try:
+        connection.open()
+    except Exception:
+        # Nothing was tried, they are due again
+        OutgoingEmail.objects.filter(id__in=[email.id for email in emails]) \
+                             .update(next_attempt=timezone.now())
+        raise
+
+    sent = failed = 0
+    with connection:
+        while emails:
+            batch_sent, batch_failed = deliver(emails, connection)
+            sent += batch_sent
+            failed += batch_failed
+            emails = claim(batch_size)
+    return sent, failed
@@ -1,3 +1,133 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+
+from . import outbox
+from .email import SENDER, render_email, send_welcome_email
+from .models import NewsLetterRecipients, OutgoingEmail
+
+
+# The test runner swaps in the locmem email backend, sent mail ends up in
+# django.core.mail.outbox
+class OutboxTests(TestCase):
+    def test_queued_then_sent(self):
+        send_welcome_email('Ada', 'ada@example.com')
+        self.assertEqual(mail.outbox, [])
+
+        call_command('send_outbox', stdout=mock.Mock())
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ['ada@example.com'])
+        self.assertEqual(message.alternatives[0][1], 'text/html')
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.status, email.attempts),
+                         (OutgoingEmail.SENT, 1))
+        self.assertIsNotNone(email.sent)
+
+    def test_claimed_emails_are_leased(self):
+        send_welcome_email('Ada', 'ada@example.com')
+        self.assertEqual(len(outbox.claim()), 1)
+        self.assertEqual(outbox.claim(), [])
+
+    def test_failed_email_is_retried(self):
+        send_welcome_email('Ada', 'ada@example.com')
+        with mock.patch.object(EmailMultiAlternatives, 'send',
+                               side_effect=OSError('Connection refused')), \
+                self.assertLogs('landingpage.outbox', 'WARNING'):
+            self.assertEqual(outbox.drain(), (0, 1))
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.status, email.attempts),
+                         (OutgoingEmail.PENDING, 1))
+        self.assertEqual(email.last_error, 'Connection refused')
+        self.assertGreater(email.next_attempt, timezone.now())
+
+        # Not due yet
+        self.assertEqual(outbox.drain(), (0, 0))
+        OutgoingEmail.objects.update(next_attempt=timezone.now())
+        self.assertEqual(outbox.drain(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        send_welcome_email('Ada', 'ada@example.com')
+        with mock.patch.object(outbox, 'MAX_ATTEMPTS', 2), \
+                mock.patch.object(EmailMultiAlternatives, 'send',
+                                  side_effect=OSError('Connection refused')), \
+                self.assertLogs('landingpage.outbox', 'WARNING'):
+            outbox.drain()
+            OutgoingEmail.objects.update(next_attempt=timezone.now())
+            outbox.drain()
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.status, email.attempts),
+                         (OutgoingEmail.FAILED, 2))
+
+    def test_idle_drain_does_not_connect(self):
+        with mock.patch.object(outbox, 'get_connection') as get_connection:
+            self.assertEqual(outbox.drain(), (0, 0))
+        get_connection.assert_not_called()
+
+    def test_mail_server_down(self):
+        send_welcome_email('Ada', 'ada@example.com')
+        connection = mock.Mock()
+        connection.open.side_effect = ConnectionRefusedError
+        with self.assertRaises(ConnectionRefusedError):
+            outbox.drain(connection=connection)
+        # Given back untried, not leased
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.attempts, 0)
+        self.assertLessEqual(email.next_attempt, timezone.now())
+
+    def test_loop_backs_off(self):
+        stop = KeyboardInterrupt()
+        with mock.patch.object(outbox, 'drain',
+                               side_effect=[OSError('down'), OSError('down'),
+                                            (1, 0)]), \
+                mock.patch('time.sleep', side_effect=[None, None, stop]) \
+                as sleep, self.assertRaises(KeyboardInterrupt):
+            call_command('send_outbox', '--loop', '--interval', '5',
+                         stdout=mock.Mock(), stderr=mock.Mock())
+        self.assertEqual([call.args[0] for call in sleep.call_args_list],
+                         [outbox.BACKOFF, 2 * outbox.BACKOFF, 5])
+
+    def test_backoff(self):
+        self.assertEqual(outbox.backoff(1), timedelta(seconds=outbox.BACKOFF))
+        self.assertEqual(outbox.backoff(3),
+                         timedelta(seconds=4 * outbox.BACKOFF))
+        self.assertEqual(outbox.backoff(50),
+                         timedelta(seconds=outbox.MAX_BACKOFF))
+
+
+class NewsletterTests(TestCase):
+    def setUp(self):
+        for name, email in [('Ada', 'ada@example.com'),
+                            ('Ada again', 'ADA@example.com'),
+                            ('Grace', 'grace@example.com')]:
+            NewsLetterRecipients.objects.create(name=name, email=email)
+
+    def test_once_per_address(self):
+        total = outbox.queue_newsletter('june', SENDER, 'June', render_email)
+        self.assertEqual(total, 2)
+        # Running it again queues nothing
+        self.assertEqual(outbox.queue_newsletter('june', SENDER, 'June',
+                                                 render_email), 0)
+        self.assertEqual(outbox.queue_newsletter('july', SENDER, 'July',
+                                                 render_email), 2)
+
+        self.assertEqual(outbox.drain(), (4, 0))
+        self.assertEqual(sorted((message.subject, message.to[0])
+                                for message in mail.outbox),
+                         [('July', 'ada@example.com'),
+                          ('July', 'grace@example.com'),
+                          ('June', 'ada@example.com'),
+                          ('June', 'grace@example.com')])
 
-# Create your tests here.
+    def test_command(self):
+        stdout = mock.Mock()
+        call_command('send_newsletter', 'june', 'June', stdout=stdout)
+        call_command('send_newsletter', 'june', 'June', stdout=stdout)
+        self.assertEqual(OutgoingEmail.objects.filter(campaign='june')
+                                              .count(), 2)
@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.http import JsonResponse
 from django.shortcuts import render
 
@@ -15,9 +16,10 @@ def newsletter(request):
     name = request.POST.get('your_name')
     email = request.POST.get('email')
 
-    recipient =  NewsLetterRecipients(name=name, email=email)
-    recipient.save()
-    send_welcome_email(name, email)
+    with transaction.atomic():
+        recipient =  NewsLetterRecipients(name=name, email=email)
+        recipient.save()
+        send_welcome_email(name, email)
     data = {'success': 'You have been successfully added to mailing list'}
     return JsonResponse(data)
 
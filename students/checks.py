@@ -0,0 +1,15 @@
+from django.core.checks import Warning, register
+
+from courses.checks import cache_is_shared
+
+
+@register()
+def progress_cache_check(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [Warning('The default cache is not shared between processes, '
+                    'flush_progress cannot see the progress events recorded '
+                    'by the web processes.',
+                    hint='Use memcached or Redis for the default cache, '
+                         'see students/progress.py.',
+                    id='students.W001')]
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.checks import cache_is_shared
+from students import progress
+
+
+class Command(BaseCommand):
+    help = 'Write the buffered progress events of the students'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and flush periodically')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='Seconds between two flushes, with --loop')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError('The events are buffered in the default cache, '
+                               'which is not shared with the web processes '
+                               '(students.W001).')
+        while True:
+            result = progress.flush()
+            if result is None:
+                self.stdout.write('Another flush is running')
+            elif result[0] or not options['loop']:
+                self.stdout.write(f'Flushed {result[0]} events '
+                                  f'into {result[1]} rows')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -1,3 +1,49 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+from courses.models import Content, Course
+
+
+# Written by the flush_progress command only, see progress.py
+class ContentProgress(models.Model):
+    user = models.ForeignKey(User,
+                                related_name='content_progress',
+                                on_delete=models.CASCADE)
+    content = models.ForeignKey(Content,
+                                related_name='progress',
+                                on_delete=models.CASCADE)
+    completed = models.DateTimeField(null=True, blank=True)
+    # Time spent on the content, from the heartbeats
+    seconds = models.PositiveIntegerField(default=0)
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'content'],
+                                               name='unique_content_progress')]
+
+
+class CourseProgress(models.Model):
+    user = models.ForeignKey(User,
+                                related_name='course_progress',
+                                on_delete=models.CASCADE)
+    course = models.ForeignKey(Course,
+                                related_name='progress',
+                                on_delete=models.CASCADE)
+    # Bit i is set when the i-th content of the course, by id,
+    # was completed
+    completed = models.BinaryField(default=bytes)
+    completed_count = models.PositiveIntegerField(default=0)
+    # Digest of the content ids the bits were numbered by
+    layout = models.CharField(max_length=40, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'course'],
+                                               name='unique_course_progress')]
+
+    def get_bits(self):
+        return int.from_bytes(bytes(self.completed), 'little')
+
+    def set_bits(self, bits):
+        self.completed = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+        self.completed_count = bin(bits).count('1')
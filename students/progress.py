@@ -0,0 +1,345 @@
+import hashlib
+import logging
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from courses.models import Content
+
+from .models import ContentProgress, CourseProgress
+
+'''
+Write-behind tracking of the contents students have finished.
+
+The complete and heartbeat endpoints do not write to the database. Every
+event gets a number from a counter in the cache and is stored under that
+number:
+
+    progress:seq            number of the last event
+    progress:event:<n>      (user id, content id, seconds, completed, time)
+    progress:flushed        number of the last event written to the database
+
+The flush_progress command reads the events since the last flush, merges
+the ones of the same student and content, and writes them with a few bulk
+queries. Only one flush runs at a time, so it can read, add and write back
+without racing other writers.
+
+A heartbeat adds the seconds spent on the content in view, at most the time
+since the previous heartbeat of the student and never more than
+PROGRESS_MAX_HEARTBEAT, so posting more often does not add more time.
+
+The web processes and flush_progress only see the same events through a
+cache shared by all of them, with an atomic incr(): memcached, as in
+education.production, or Redis. With the per-process default of
+education.settings, flush_progress would never see an event. The
+students.W001 check warns about such a cache, and the command refuses to
+run with one.
+
+CourseProgress keeps a bitmap per student and course with one bit per
+content, numbered by the contents of the course in id order, so the course
+page gets the progress from a single row. The row also stores a digest of
+that numbering. When contents were added or deleted since, the bitmap is
+rebuilt from the ContentProgress rows the next time it is read or written.
+'''
+
+logger = logging.getLogger(__name__)
+
+EVENT_TIMEOUT = getattr(settings, 'PROGRESS_EVENT_TIMEOUT', 24 * 3600)
+MAX_HEARTBEAT = getattr(settings, 'PROGRESS_MAX_HEARTBEAT', 120)
+FLUSH_BATCH = 1000
+LAYOUT_TIMEOUT = 24 * 3600
+LOCK_TIMEOUT = 300
+RECORD_ATTEMPTS = 3
+
+SEQ_KEY = 'progress:seq'
+FLUSHED_KEY = 'progress:flushed'
+LOCK_KEY = 'progress:flush:lock'
+# Events that were numbered but not stored yet when the last flush ran
+GAP_KEY = 'progress:gap'
+
+
+def _event_key(seq):
+    return f'progress:event:{seq}'
+
+
+def _layout_key(course_id):
+    return f'progress:layout:{course_id}'
+
+
+def _beat_key(user_id):
+    return f'progress:beat:{user_id}'
+
+
+def _course_key(content_id):
+    return f'progress:course:{content_id}'
+
+
+def course_layout(course_id):
+    # The content ids of the course in bit order, and a digest of them
+    key = _layout_key(course_id)
+    entry = cache.get(key)
+    if entry is None:
+        layout = tuple(Content.objects.filter(module__course_id=course_id)
+                                      .order_by('id')
+                                      .values_list('id', flat=True))
+        digest = hashlib.sha1(
+                    ','.join(map(str, layout)).encode()).hexdigest()
+        entry = (layout, digest)
+        cache.set(key, entry, LAYOUT_TIMEOUT)
+    return entry
+
+
+def content_course_id(content_id):
+    key = _course_key(content_id)
+    course_id = cache.get(key)
+    if course_id is None:
+        course_id = Content.objects.filter(id=content_id) \
+                                   .values_list('module__course_id', flat=True) \
+                                   .first()
+        if course_id is None:
+            return None
+        cache.set(key, course_id, LAYOUT_TIMEOUT)
+    return course_id
+
+
+def forget_content(content_id, course_id):
+    cache.delete_many([_course_key(content_id), _layout_key(course_id)])
+
+
+def forget_course(course_id):
+    cache.delete(_layout_key(course_id))
+
+
+def heartbeat_seconds(user_id, seconds):
+    '''
+    Caps the seconds of a heartbeat at the time since the previous heartbeat
+    of the student, so a client cannot add more time than has passed.
+    '''
+    now = time.time()
+    key = _beat_key(user_id)
+    last = cache.get(key)
+    cache.set(key, now, MAX_HEARTBEAT)
+    if last is not None:
+        seconds = min(seconds, round(now - last))
+    return max(0, min(seconds, MAX_HEARTBEAT))
+
+
+def record(user_id, content_id, seconds=0, completed=False):
+    seconds = max(0, min(int(seconds), MAX_HEARTBEAT))
+    for _ in range(RECORD_ATTEMPTS):
+        try:
+            seq = cache.incr(SEQ_KEY)
+            break
+        except ValueError:
+            if cache.add(SEQ_KEY, 0, None):
+                # A new counter, the flush starts from its beginning
+                cache.set(FLUSHED_KEY, 0, None)
+    else:
+        # Neither incr() nor add() worked, the cache server is unreachable
+        logger.warning('Progress event of user %s dropped, no cache',
+                       user_id)
+        return
+    cache.set(_event_key(seq),
+              (user_id, content_id, seconds, completed, time.time()),
+              EVENT_TIMEOUT)
+
+
+def completed_ids(progress, layout):
+    bits = progress.get_bits() if progress else 0
+    return {content_id for i, content_id in enumerate(layout)
+            if bits >> i & 1}
+
+
+def _read_events(start, head):
+    events = []
+    gap = cache.get(GAP_KEY)
+    seq = start
+    while seq < head:
+        keys = [_event_key(n) for n in range(seq + 1,
+                                             min(seq + FLUSH_BATCH, head) + 1)]
+        found = cache.get_many(keys)
+        for key in keys:
+            if key in found:
+                events.append(found[key])
+            elif gap != seq + 1:
+                # Numbered but not stored yet, wait for the next flush.
+                # If it is still missing then, it is lost.
+                cache.set(GAP_KEY, seq + 1, None)
+                return events, seq
+            seq += 1
+    return events, seq
+
+
+def _merge(events):
+    merged = {}
+    for user_id, content_id, seconds, completed, at in events:
+        entry = merged.setdefault((user_id, content_id),
+                                  {'seconds': 0, 'completed': None,
+                                   'last_seen': at})
+        entry['seconds'] += seconds
+        entry['last_seen'] = max(entry['last_seen'], at)
+        if completed and (entry['completed'] is None
+                          or at < entry['completed']):
+            entry['completed'] = at
+    return merged
+
+
+def _timestamp(value):
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
+
+def _write_content_progress(merged):
+    content_ids = {content_id for _, content_id in merged}
+    existing = {(p.user_id, p.content_id): p for p in
+                ContentProgress.objects.filter(
+                        user_id__in={user_id for user_id, _ in merged},
+                        content_id__in=content_ids)
+                if (p.user_id, p.content_id) in merged}
+    # Events of contents or students deleted in the meantime are dropped
+    valid = set(Content.objects.filter(id__in=content_ids)
+                               .values_list('id', flat=True))
+    users = set(User.objects.filter(id__in={user_id for user_id, _ in merged})
+                            .values_list('id', flat=True))
+
+    new, changed, newly_completed = [], [], []
+    for (user_id, content_id), entry in merged.items():
+        if content_id not in valid or user_id not in users:
+            continue
+        completed = _timestamp(entry['completed']) \
+                        if entry['completed'] else None
+        progress = existing.get((user_id, content_id))
+        if progress is None:
+            progress = ContentProgress(user_id=user_id, content_id=content_id,
+                                       completed=completed,
+                                       seconds=entry['seconds'],
+                                       last_seen=_timestamp(entry['last_seen']))
+            new.append(progress)
+        else:
+            if progress.completed is not None:
+                completed = None
+            progress.completed = progress.completed or completed
+            progress.seconds += entry['seconds']
+            progress.last_seen = max(progress.last_seen,
+                                     _timestamp(entry['last_seen']))
+            changed.append(progress)
+        if completed:
+            newly_completed.append((user_id, content_id))
+
+    ContentProgress.objects.bulk_create(new, batch_size=FLUSH_BATCH)
+    ContentProgress.objects.bulk_update(changed,
+                                        ['completed', 'seconds', 'last_seen'],
+                                        batch_size=FLUSH_BATCH)
+    return len(new) + len(changed), newly_completed
+
+
+def _write_course_progress(newly_completed):
+    by_course = {}
+    for user_id, content_id in newly_completed:
+        course_id = content_course_id(content_id)
+        if course_id is not None:
+            by_course.setdefault((user_id, course_id), []).append(content_id)
+    if not by_course:
+        return
+
+    existing = {(p.user_id, p.course_id): p for p in
+                CourseProgress.objects.filter(
+                        user_id__in={user_id for user_id, _ in by_course},
+                        course_id__in={course_id for _, course_id in by_course})
+                if (p.user_id, p.course_id) in by_course}
+    new, changed = [], []
+    now = timezone.now()
+    for (user_id, course_id), content_ids in by_course.items():
+        layout, digest = course_layout(course_id)
+        progress = existing.get((user_id, course_id))
+        if progress is None:
+            progress = CourseProgress(user_id=user_id, course_id=course_id,
+                                      layout=digest)
+            new.append(progress)
+        else:
+            # bulk_update() does not set auto_now fields
+            progress.updated = now
+            changed.append(progress)
+        if progress.layout != digest:
+            _rebuild(progress, layout, digest)
+            continue
+        positions = {content_id: i for i, content_id in enumerate(layout)}
+        bits = progress.get_bits()
+        for content_id in content_ids:
+            if content_id in positions:
+                bits |= 1 << positions[content_id]
+        progress.set_bits(bits)
+
+    CourseProgress.objects.bulk_create(new, batch_size=FLUSH_BATCH)
+    CourseProgress.objects.bulk_update(changed,
+                                       ['completed', 'completed_count',
+                                        'layout', 'updated'],
+                                       batch_size=FLUSH_BATCH)
+
+
+def _rebuild(progress, layout, digest):
+    # The contents of the course changed since the bits were set,
+    # number them again from the completed contents
+    completed = set(ContentProgress.objects
+                            .filter(user_id=progress.user_id,
+                                    content__module__course_id=progress.course_id,
+                                    completed__isnull=False)
+                            .values_list('content_id', flat=True))
+    bits = 0
+    for i, content_id in enumerate(layout):
+        if content_id in completed:
+            bits |= 1 << i
+    progress.set_bits(bits)
+    progress.layout = digest
+
+
+def get_course_progress(user_id, course_id):
+    '''
+    Returns the CourseProgress of the student, or None when nothing was
+    completed yet, and the content ids of the course in bit order.
+    '''
+    layout, digest = course_layout(course_id)
+    progress = CourseProgress.objects.filter(user_id=user_id,
+                                             course_id=course_id).first()
+    if progress is not None and progress.layout != digest:
+        _rebuild(progress, layout, digest)
+        CourseProgress.objects.filter(id=progress.id) \
+                              .update(completed=progress.completed,
+                                      completed_count=progress.completed_count,
+                                      layout=digest)
+    return progress, layout
+
+
+def flush():
+    '''
+    Writes the buffered events to the database and returns the number of
+    events read and of rows written, or None when another flush is running.
+    '''
+    if not cache.add(LOCK_KEY, 1, LOCK_TIMEOUT):
+        return None
+    try:
+        head = cache.get(SEQ_KEY) or 0
+        start = cache.get(FLUSHED_KEY)
+        if start is None or start > head:
+            # The cache lost the flush position (or the counter),
+            # start over from the newest event
+            if head:
+                logger.warning('Progress flush position lost, '
+                               'restarting at %s', head)
+            start = head
+        events, last = _read_events(start, head)
+        merged = _merge(events)
+        written = 0
+        if merged:
+            with transaction.atomic():
+                written, newly_completed = _write_content_progress(merged)
+                _write_course_progress(newly_completed)
+        cache.set(FLUSHED_KEY, last, None)
+        cache.delete_many([_event_key(n) for n in range(start + 1, last + 1)])
+        return len(events), written
+    finally:
+        cache.delete(LOCK_KEY)
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from courses import deletion
+from courses.models import Content, Course, Module
+
+from . import progress
+
+
+def _course_id(content):
+    if Content.module.is_cached(content):
+        return content.module.course_id
+    return Module.objects.filter(id=content.module_id) \
+                         .values_list('course_id', flat=True) \
+                         .first()
+
+
+def _forget(content):
+    content_id, course_id = content.id, _course_id(content)
+    # The next read renumbers the bits of the course, see progress.py
+    transaction.on_commit(
+        lambda: progress.forget_content(content_id, course_id))
+
+
+@receiver(post_save, sender=Content)
+def content_added(sender, instance, created, **kwargs):
+    if created:
+        _forget(instance)
+
+
+@receiver(post_delete, sender=Content)
+def content_removed(sender, instance, **kwargs):
+    # The module forgets the layout once for all its contents
+    if not deletion.is_deleted(Module, instance.module_id):
+        _forget(instance)
+
+
+@receiver(post_delete, sender=Module)
+def module_removed(sender, instance, **kwargs):
+    # The progress of a deleted course goes with it. The course ids of the
+    # deleted contents expire, flush() drops their events
+    course_id = instance.course_id
+    if not deletion.is_deleted(Course, course_id):
+        transaction.on_commit(lambda: progress.forget_course(course_id))
@@ -1,3 +1,170 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from courses.models import Content, Course, Module, Subject, Text
+
+from . import checks, progress
+from .models import ContentProgress, CourseProgress
+
+
+class ProgressTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        instructor = User.objects.create_user('instructor')
+        cls.student = User.objects.create_user('student')
+        subject = Subject.objects.create(title='Maths', slug='maths')
+        cls.course = Course.objects.create(owner=instructor, subject=subject,
+                                           title='Algebra', slug='algebra',
+                                           overview='Letters and numbers.')
+        cls.course.students.add(cls.student)
+        module = Module.objects.create(course=cls.course, title='Basics')
+        cls.contents = [
+            Content.objects.create(module=module, item=Text.objects.create(
+                                owner=instructor, title=f'Text {i}',
+                                content='Read me.'))
+            for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+
+class RecordAndFlushTests(ProgressTestCase):
+    def test_flush_merges_the_events(self):
+        first, second, _ = [content.id for content in self.contents]
+        progress.record(self.student.id, first, completed=True)
+        progress.record(self.student.id, second, seconds=30)
+        progress.record(self.student.id, second, seconds=30)
+        self.assertFalse(ContentProgress.objects.exists())
+
+        self.assertEqual(progress.flush(), (3, 2))
+        done = ContentProgress.objects.get(content_id=first)
+        self.assertIsNotNone(done.completed)
+        seen = ContentProgress.objects.get(content_id=second)
+        self.assertEqual((seen.completed, seen.seconds), (None, 60))
+
+        course_progress, layout = progress.get_course_progress(
+                                            self.student.id, self.course.id)
+        self.assertEqual(course_progress.completed_count, 1)
+        self.assertEqual(progress.completed_ids(course_progress, layout),
+                         {first})
+        # Nothing left to write
+        self.assertEqual(progress.flush(), (0, 0))
+
+    def test_completed_once(self):
+        first = self.contents[0].id
+        progress.record(self.student.id, first, completed=True)
+        progress.flush()
+        progress.record(self.student.id, first, completed=True)
+        progress.flush()
+        self.assertEqual(CourseProgress.objects.get().completed_count, 1)
+
+    def test_heartbeat_is_capped(self):
+        progress.record(self.student.id, self.contents[0].id, seconds=10 ** 6)
+        progress.flush()
+        self.assertEqual(ContentProgress.objects.get().seconds,
+                         progress.MAX_HEARTBEAT)
+
+    def test_one_flush_at_a_time(self):
+        cache.add(progress.LOCK_KEY, 1)
+        self.assertIsNone(progress.flush())
+
+    def test_contents_added_later(self):
+        progress.record(self.student.id, self.contents[1].id, completed=True)
+        progress.flush()
+        Content.objects.create(module=self.contents[0].module,
+                               item=Text.objects.create(
+                                        owner=self.course.owner,
+                                        title='New', content='Read me.'))
+        course_progress, layout = progress.get_course_progress(
+                                            self.student.id, self.course.id)
+        self.assertEqual(progress.completed_ids(course_progress, layout),
+                         {self.contents[1].id})
+
+
+class ContentProgressViewTests(ProgressTestCase):
+    def setUp(self):
+        super().setUp()
+        # The endpoints are exempt from CSRF, for the page's scripts
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.student)
+
+    def post(self, name, content, body='{}'):
+        return self.client.post(reverse(name, args=[content.id]), body,
+                                content_type='application/json')
+
+    def test_complete_and_heartbeat(self):
+        response = self.post('student_content_complete', self.contents[0])
+        self.assertEqual(response.status_code, 200)
+        response = self.post('student_content_heartbeat', self.contents[1],
+                             '{"seconds": 15}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(progress.flush(), (2, 2))
+
+    def test_heartbeats_add_up_to_the_time_passed(self):
+        beat = '{"seconds": 60}'
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            self.post('student_content_heartbeat', self.contents[0], beat)
+            # Sent again right away, nothing more
+            self.post('student_content_heartbeat', self.contents[0], beat)
+        with mock.patch('time.time', return_value=now + 30):
+            self.post('student_content_heartbeat', self.contents[1],
+                      '{"seconds": 100000}')
+        progress.flush()
+        self.assertEqual(dict(ContentProgress.objects.values_list(
+                                                'content_id', 'seconds')),
+                         {self.contents[0].id: 60, self.contents[1].id: 30})
+
+    def test_bad_seconds(self):
+        response = self.post('student_content_heartbeat', self.contents[1],
+                             '{"seconds": "soon"}')
+        self.assertEqual(response.status_code, 400)
+
+    def test_not_enrolled(self):
+        self.client.force_login(User.objects.create_user('stranger'))
+        response = self.post('student_content_complete', self.contents[0])
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(progress.flush(), (0, 0))
+
+
+class SharedCacheTests(TestCase):
+    def test_local_cache(self):
+        self.assertEqual([warning.id for warning in
+                          checks.progress_cache_check(None)],
+                         ['students.W001'])
+        with self.assertRaises(CommandError):
+            call_command('flush_progress')
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache'}})
+    def test_shared_cache(self):
+        self.assertEqual(checks.progress_cache_check(None), [])
+
+
+class StudentCourseDetailTests(ProgressTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.student)
+        self.url = reverse('student_course_detail', args=[self.course.id])
+
+    def test_edit_shows_in_the_page(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Read me.')
+        etag = response['ETag']
+
+        item = self.contents[0].item
+        item.content = 'Read me again.'
+        item.save()
+        # The cached fragment of the old version is not served
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Read me again.')
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.get(self.url,
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
@@ -16,4 +16,10 @@ urlpatterns = [
     path('course/<pk>/<module_id>/', 
                     (views.StudentCourseDetailView.as_view()),
                                             name='student_course_detail_module'),
+    path('content/<int:content_id>/complete/',
+                    views.ContentProgressView.as_view(completed=True),
+                                            name='student_content_complete'),
+    path('content/<int:content_id>/heartbeat/',
+                    views.ContentProgressView.as_view(),
+                                            name='student_content_heartbeat'),
 ]
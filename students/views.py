@@ -1,15 +1,24 @@
+from braces.views import CsrfExemptMixin, JsonRequestResponseMixin
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import OuterRef, Subquery
 from django.shortcuts import render
 from django.urls import reverse_lazy
+from django.views.generic.base import View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, FormView
 from django.views.generic.list import ListView
 
+from courses.conditional import ConditionalMixin, make_etag
+from courses.enrollment import enrolled_course_ids, is_enrolled
 from courses.models import Course
+from courses.rendering import template_version
+from education.querybudget import query_budget
 
+from . import progress
 from .forms import CourseEnrollForm
+from .models import CourseProgress
 
 
 # Create your views here.
@@ -41,32 +50,97 @@ class StudentEnrollCourseView(LoginRequiredMixin, FormView):
         return reverse_lazy('student_course_detail', args=[self.course.id])
 
 # Accessing the course contents
+@query_budget(4)
 class StudentCourseListView(LoginRequiredMixin, ListView):
     model = Course
     template_name = 'students/course/list.html'
 
     def get_queryset(self):
         qs = super().get_queryset()
-        return qs.filter(students__in=[self.request.user])
+        return qs.filter(id__in=enrolled_course_ids(self.request.user.id))
         
 
-class StudentCourseDetailView(DetailView):
+@query_budget(14)
+class StudentCourseDetailView(ConditionalMixin, DetailView):
     model = Course
     template_name = 'students/course/detail.html'
 
+    def get_version(self):
+        user_id = self.request.user.id
+        course_id = int(self.kwargs['pk'])
+        # Enrollment first, others must not learn when the course changed
+        if not is_enrolled(user_id, course_id):
+            return None
+        # The progress summary changes when the progress is flushed
+        progress_updated = CourseProgress.objects \
+                                .filter(user_id=user_id, course=OuterRef('pk')) \
+                                .values('updated')[:1]
+        row = Course.objects.filter(pk=course_id) \
+                    .annotate(progress_updated=Subquery(progress_updated)) \
+                    .values('content_version', 'updated', 'progress_updated') \
+                    .first()
+        if row is None:
+            return None
+        updated = max(filter(None, (row['updated'],
+                                     row['progress_updated'])))
+        etag = make_etag('student', row['content_version'], user_id,
+                         self.kwargs.get('module_id'), row['progress_updated'],
+                         template_version(self.template_name))
+        return etag, updated
+
     def get_queryset(self):
         qs = super().get_queryset()
-        return qs.filter(students__in=[self.request.user])
+        if not is_enrolled(self.request.user.id, int(self.kwargs['pk'])):
+            return qs.none()
+        return qs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Get course object
-        course = self.get_object()
+        course = self.object
         if 'module_id' in self.kwargs:
             # Get current module
             context['module'] = course.modules.get(id=self.kwargs['module_id'])
         else:
             # Get first module
             context['module'] = course.modules.all()[0]
-
-        return context
\ No newline at end of file
+        # Lazy, so a cached fragment never touches the database
+        context['contents'] = context['module'].contents.with_items()
+        course_progress, layout = progress.get_course_progress(
+                                            self.request.user.id, course.id)
+        context['completed_count'] = course_progress.completed_count \
+                                        if course_progress else 0
+        context['total_contents'] = len(layout)
+        context['completed_ids'] = sorted(
+                                progress.completed_ids(course_progress, layout))
+
+        return context
+
+
+'''
+Progress events of the content a student is looking at. Only buffered here,
+the flush_progress command writes them, see students/progress.py.
+'''
+# CsrfExemptMixin comes first, as_view() only sees the csrf_exempt flag on
+# the dispatch() it finds first
+class ContentProgressView(CsrfExemptMixin,
+                          LoginRequiredMixin,
+                          JsonRequestResponseMixin,
+                          View):
+    # Heartbeats add the seconds spent, completes mark the content done
+    completed = False
+
+    def post(self, request, content_id):
+        course_id = progress.content_course_id(content_id)
+        if course_id is None or not is_enrolled(request.user.id, course_id):
+            return self.render_json_response(
+                        {'error': 'Not enrolled in this course.'}, status=403)
+        seconds = 0
+        if not self.completed:
+            try:
+                seconds = int((self.request_json or {}).get('seconds', 0))
+            except (AttributeError, TypeError, ValueError):
+                return self.render_bad_request_response(
+                        {'error': 'seconds must be a number.'})
+            seconds = progress.heartbeat_seconds(request.user.id, seconds)
+        progress.record(request.user.id, content_id, seconds, self.completed)
+        return self.render_json_response({'saved': 'OK'})
\ No newline at end of file